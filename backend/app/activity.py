@@ -0,0 +1,114 @@
+"""
+Daily activity rollups.
+
+Every submission adds to the user's row for the day in user_daily_activity.
+The global activity_rollups table holds totals per day, ISO week and month,
+counting each user once per period. Its updates run in the background task
+so the request path does not contend on those few hot rows. Reports read
+only the rollups, so they cost one row per period shown.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from .models.activity import ActivityRollup, UserDailyActivity
+from .question_stats import upsert_counters
+
+PERIODS = ("day", "week", "month")
+COUNTERS = ("xp", "lessons", "seconds", "mistakes")
+# Longer client-reported durations are assumed to be idle time
+MAX_ATTEMPT_SECONDS = 60 * 60
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def period_start(period: str, day: date) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def record_activity(db: Session, user_id: int, xp: int, lessons: int, seconds: int, mistakes: int) -> dict:
+    """Add to the user's row for today; the caller commits.
+
+    Returns the deltas for add_to_rollups, including the periods in which
+    this is the user's first activity.
+    """
+    day = today()
+    counts = {
+        "xp": xp,
+        "lessons": lessons,
+        "seconds": max(0, min(seconds, MAX_ATTEMPT_SECONDS * lessons)),
+        "mistakes": mistakes,
+    }
+    table = UserDailyActivity.__table__
+    lessons_today = upsert_counters(
+        db, table, ["user_id", "day"], COUNTERS,
+        {"user_id": user_id, "day": day, **counts},
+        returning=[table.c.lessons],
+    ).scalar_one()
+
+    new_periods = []
+    if lessons_today == lessons:
+        new_periods.append("day")
+        # At most one lookup per user per day
+        for period in ("week", "month"):
+            earlier = db.query(UserDailyActivity.day).filter(
+                UserDailyActivity.user_id == user_id,
+                UserDailyActivity.day >= period_start(period, day),
+                UserDailyActivity.day < day,
+            ).first()
+            if earlier is None:
+                new_periods.append(period)
+    return {"day": day.isoformat(), **counts, "new_periods": new_periods}
+
+
+def add_to_rollups(db: Session, activity: dict):
+    """Apply deltas from record_activity to the global rollups."""
+    day = date.fromisoformat(activity["day"])
+    upsert_counters(db, ActivityRollup.__table__, ["period", "start"], ("active_users",) + COUNTERS, [
+        {
+            "period": period,
+            "start": period_start(period, day),
+            "active_users": int(period in activity["new_periods"]),
+            **{name: activity[name] for name in COUNTERS},
+        }
+        for period in PERIODS
+    ])
+
+
+def activity_payload(row, day: date) -> dict:
+    return {
+        "day": day,
+        "xp": row.xp if row else 0,
+        "lessons": row.lessons if row else 0,
+        "minutes": round(row.seconds / 60) if row else 0,
+        "mistakes": row.mistakes if row else 0,
+    }
+
+
+def user_days(db: Session, user_id: int, start: date, end: date) -> List[UserDailyActivity]:
+    """The user's active days in [start, end]."""
+    return db.query(UserDailyActivity).filter(
+        UserDailyActivity.user_id == user_id,
+        UserDailyActivity.day >= start,
+        UserDailyActivity.day <= end,
+    ).order_by(UserDailyActivity.day).all()
+
+
+def current_streak(days: List[date], until: Optional[date] = None) -> int:
+    """Consecutive active days ending today, or yesterday if today has no activity yet."""
+    until = until or today()
+    active = set(days)
+    if until not in active:
+        until -= timedelta(days=1)
+    streak = 0
+    while until in active:
+        streak += 1
+        until -= timedelta(days=1)
+    return streak
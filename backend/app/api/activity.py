@@ -0,0 +1,57 @@
+"""
+Activity history for the current user, read from the daily rollups.
+"""
+from datetime import date, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.activity import activity_payload, current_streak, period_start, today, user_days
+from app.api.progress import get_current_reader
+from app.database import get_read_db
+from app.models.user import User
+
+router = APIRouter()
+
+MAX_CALENDAR_DAYS = 366
+
+
+@router.get("/week")
+def get_week(
+    start: Optional[date] = None,
+    current_user: User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db),
+):
+    """XP and activity for each day of the week containing ``start`` (default: this week)."""
+    monday = period_start("week", start or today())
+    rows = {row.day: row for row in user_days(db, current_user.id, monday, monday + timedelta(days=6))}
+    days = [activity_payload(rows.get(day), day) for day in (monday + timedelta(days=i) for i in range(7))]
+    return {
+        "start": monday,
+        "xp": sum(d["xp"] for d in days),
+        "active_days": len(rows),
+        "days": days,
+    }
+
+
+@router.get("/calendar")
+def get_calendar(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db),
+):
+    """Active days between ``start`` and ``end`` inclusive (default: the last year)."""
+    end = end or today()
+    start = start or end - timedelta(days=MAX_CALENDAR_DAYS - 1)
+    if start > end or (end - start).days >= MAX_CALENDAR_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range must be 1 to {MAX_CALENDAR_DAYS} days")
+    rows = user_days(db, current_user.id, start, end)
+    return {
+        "start": start,
+        "end": end,
+        "active_days": len(rows),
+        "streak": current_streak([row.day for row in rows], until=min(end, today())),
+        "days": [activity_payload(row, row.day) for row in rows],
+    }
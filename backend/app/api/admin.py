@@ -0,0 +1,148 @@
+"""
+Admin-only endpoints: bulk data access for the data team.
+"""
+import io
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from app.activity import PERIODS
+from app.api.progress import get_current_reader, get_current_user
+from app import content_audit, enrollment, tasks
+from app.database import get_db, get_read_db
+from app.models.activity import ActivityRollup
+from app.models.lesson import Lesson
+from app.export import EXPORT_TABLES, FORMATS, export_chunks
+from app.models.user import User
+
+router = APIRouter()
+
+
+class AuditQuestion(BaseModel):
+    question: str
+    answer: str = ""
+
+
+class LessonCheck(BaseModel):
+    # An existing lesson, or the questions of one about to be imported
+    lesson_id: Optional[int] = None
+    questions: List[AuditQuestion] = []
+    threshold: Optional[float] = Field(None, gt=0, le=1)
+
+
+def require_admin(current_user: User = Depends(get_current_user)):
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
+def require_admin_reader(current_user: User = Depends(get_current_reader)):
+    """require_admin for read-only endpoints."""
+    return require_admin(current_user)
+
+
+@router.get("/export/{table}")
+def export_table(
+    table: str,
+    format: str = Query("ndjson"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    level_id: Optional[int] = None,
+    admin: User = Depends(require_admin),
+):
+    """Stream users, user_progress, wrong_questions or wrong_questions_archive as NDJSON or CSV."""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="Unknown table")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    chunks = export_chunks(table, format, start=start, end=end, level_id=level_id)
+    return StreamingResponse(
+        chunks,
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
+
+
+@router.post("/enroll")
+def enroll_roster(
+    roster: UploadFile = File(...),
+    format: Optional[str] = Query(None),
+    admin: User = Depends(require_admin),
+):
+    """Create accounts for a CSV or NDJSON roster, streaming one NDJSON result per row."""
+    format = format or ("csv" if (roster.filename or "").lower().endswith(".csv") else "ndjson")
+    if format not in enrollment.FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+    try:
+        text = roster.file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Roster must be UTF-8")
+    rows = enrollment.read_roster(io.StringIO(text, newline=""), format)
+    return StreamingResponse(
+        (json.dumps(result) + "\n" for result in enrollment.enroll(rows)),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/tasks")
+def task_metrics(admin: User = Depends(require_admin)):
+    """Background pipeline health: queue depth, lag and outbox backlog."""
+    return tasks.metrics()
+
+
+@router.get("/activity")
+def activity_report(
+    period: str = Query("day"),
+    limit: int = Query(30, ge=1, le=366),
+    admin: User = Depends(require_admin_reader),
+    db: Session = Depends(get_read_db),
+):
+    """Active users (DAU, WAU or MAU) and totals for the latest ``limit`` periods, oldest first."""
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail="Period must be day, week or month")
+    rows = db.query(ActivityRollup).filter(
+        ActivityRollup.period == period
+    ).order_by(ActivityRollup.start.desc()).limit(limit).all()
+    return [
+        {
+            "start": row.start,
+            "active_users": row.active_users,
+            "xp": row.xp,
+            "lessons": row.lessons,
+            "minutes": round(row.seconds / 60),
+            "mistakes": row.mistakes,
+        }
+        for row in reversed(rows)
+    ]
+
+
+@router.get("/content-audit")
+def audit_content(
+    threshold: Optional[float] = Query(None, gt=0, le=1),
+    admin: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Clusters of near-duplicate questions across the catalog, largest first."""
+    clusters = content_audit.find_clusters(db, threshold)
+    return {"clusters": clusters, "questions": sum(cluster["size"] for cluster in clusters)}
+
+
+@router.post("/content-audit/check")
+def check_lesson_content(
+    check: LessonCheck,
+    admin: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Catalog questions similar to each question of a lesson."""
+    if check.lesson_id is not None:
+        if db.get(Lesson, check.lesson_id) is None:
+            raise HTTPException(status_code=404, detail="Lesson not found")
+        return content_audit.check_lesson(db, check.lesson_id, check.threshold)
+    if not check.questions:
+        raise HTTPException(status_code=400, detail="Give a lesson_id or questions")
+    return content_audit.check_questions(db, [q.model_dump() for q in check.questions], threshold=check.threshold)
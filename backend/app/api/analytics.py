@@ -0,0 +1,70 @@
+"""
+Content analytics: per-question difficulty and distractors for authors.
+"""
+from collections import defaultdict
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app.api.admin import require_admin_reader
+from app.database import get_read_db
+from app.grading import normalize_answer
+from app.models.lesson import Lesson
+from app.models.question import Question
+from app.models.question_stats import QuestionOptionStat, QuestionStat
+from app.models.user import User
+
+router = APIRouter()
+
+
+@router.get("/questions")
+def get_question_stats(
+    lesson_id: Optional[int] = None,
+    level_id: Optional[int] = None,
+    distractors: int = Query(3, ge=0, le=20),
+    admin: User = Depends(require_admin_reader),
+    db: Session = Depends(get_read_db),
+):
+    """Miss rate and most-picked wrong answers per question of a lesson or level."""
+    if (lesson_id is None) == (level_id is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of lesson_id or level_id")
+    if lesson_id is not None:
+        lesson_ids = [lesson_id]
+    else:
+        lesson_ids = [row[0] for row in db.query(Lesson.id).filter(Lesson.level_id == level_id)]
+
+    rows = db.query(
+        Question.lesson_id, Question.question_id, Question.prompt, Question.answer,
+        QuestionStat.attempts, QuestionStat.misses,
+    ).outerjoin(QuestionStat, and_(
+        QuestionStat.lesson_id == Question.lesson_id,
+        QuestionStat.question_id == Question.question_id,
+    )).filter(Question.lesson_id.in_(lesson_ids)).order_by(Question.lesson_id, Question.position).all()
+
+    picks = defaultdict(list)
+    option_rows = db.query(QuestionOptionStat).filter(
+        QuestionOptionStat.lesson_id.in_(lesson_ids)
+    ).order_by(QuestionOptionStat.picks.desc())
+    for option_stat in option_rows:
+        picks[option_stat.lesson_id, option_stat.question_id].append(option_stat)
+
+    result = []
+    for row in rows:
+        attempts = row.attempts or 0
+        misses = row.misses or 0
+        correct = normalize_answer(row.answer)
+        wrong_picks = [p for p in picks[row.lesson_id, row.question_id] if p.option != correct]
+        result.append({
+            "lesson_id": row.lesson_id,
+            "question_id": row.question_id,
+            "question": row.prompt,
+            "attempts": attempts,
+            "misses": misses,
+            "miss_rate": misses / attempts if attempts else None,
+            "top_distractors": [
+                {"option": p.option, "picks": p.picks} for p in wrong_picks[:distractors]
+            ],
+        })
+    return result
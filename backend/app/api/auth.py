@@ -8,26 +8,20 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 from ..database import get_db
 from ..models.user import User
 from ..config import settings
+from .. import sharding
+from ..passwords import get_password_hash, verify_password
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-def verify_password(plain_password, hashed_password):
-    # bcrypt has a 72-byte limit, truncate manually to avoid error
-    return pwd_context.verify(plain_password[:72], hashed_password)
-
-def get_password_hash(password):
-    # bcrypt has a 72-byte limit, truncate manually to avoid error
-    return pwd_context.hash(password[:72])
-
 def authenticate_user(db: Session, email: str, password: str):
+    if sharding.is_enabled() and sharding.route_session_for_subject(db, email) is None:
+        return False
     user = db.query(User).filter(User.email == email).first()
     if not user:
         return False
@@ -89,9 +83,12 @@ def register(
     db: Session = Depends(get_db)
 ):
     # Check if user exists
-    existing = db.query(User).filter(
-        (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
+    if sharding.is_enabled():
+        existing = sharding.directory_conflict(db, user_data.email, user_data.username)
+    else:
+        existing = db.query(User).filter(
+            (User.email == user_data.email) | (User.username == user_data.username)
+        ).first()
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -106,6 +103,9 @@ def register(
         experience=0,
         hearts=5,
     )
+    if sharding.is_enabled():
+        # Reserves the global id and routes the session to the user's shard
+        db_user.id = sharding.allocate_user(db, user_data.email, user_data.username)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
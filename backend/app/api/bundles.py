@@ -0,0 +1,56 @@
+"""
+Offline content bundles: per-level catalog bundles and deltas between their versions.
+
+Clients fetch the manifest, compare each level's hash with the bundle they
+hold, and download either the delta from their hash or the whole bundle.
+Bundles and deltas are immutable, named by content hash.
+"""
+import gzip
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from app.bundles import HASH, bundle_manifest, delta_path, object_path
+from app.catalog import versioned
+from app.compression import Precompressed, accepted_encoding
+
+router = APIRouter()
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _manifest_body() -> Precompressed:
+    return versioned("bundles.manifest_body", lambda db: Precompressed.json(bundle_manifest()))
+
+
+def _stored(request: Request, path, digest: str, media_type: str) -> Response:
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Bundle not found")
+    headers = {"ETag": f'"{digest}"', "Vary": "Accept-Encoding", "Cache-Control": IMMUTABLE}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if accepted_encoding(request.headers.get("accept-encoding", ""), ("gzip",)) is not None:
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(path, media_type=media_type, headers=headers)
+    return Response(gzip.decompress(path.read_bytes()), media_type=media_type, headers=headers)
+
+
+@router.get("/manifest")
+def manifest(request: Request):
+    """Every level's current bundle hash and the deltas available to it from earlier hashes."""
+    return _manifest_body().response(request)
+
+
+@router.get("/objects/{digest}")
+def bundle_object(digest: str, request: Request):
+    if not HASH.fullmatch(digest):
+        raise HTTPException(status_code=404, detail="Bundle not found")
+    return _stored(request, object_path(digest), digest, "application/json")
+
+
+@router.get("/deltas/{old}/{new}")
+def bundle_delta(old: str, new: str, request: Request):
+    """Operations rebuilding bundle ``new`` from bundle ``old``; see app.bundles for the format."""
+    if not HASH.fullmatch(old) or not HASH.fullmatch(new):
+        raise HTTPException(status_code=404, detail="Bundle not found")
+    return _stored(request, delta_path(old, new), f"{old}-{new}", "application/octet-stream")
@@ -0,0 +1,71 @@
+"""
+Server-sent events: pushes stats and leaderboard changes instead of polling.
+"""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from jose import JWTError, jwt
+
+from app import sharding
+from app.api.progress import user_stats
+from app.config import settings
+from app.database import SessionLocal
+from app.events import event_stream, user_topic
+from app.models.user import User
+
+router = APIRouter()
+
+
+def _user_from_token(token: str) -> User:
+    credentials_exception = HTTPException(
+        status_code=401,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        email: str = payload.get("sub")
+        if email is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+    # A short-lived session: nothing is held open for the life of the stream
+    db = SessionLocal()
+    try:
+        if sharding.is_enabled():
+            sharding.route_session_for_subject(db, email)
+        user = db.query(User).filter(User.email == email).first()
+        if user is None:
+            raise credentials_exception
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+@router.get("/stream")
+async def stream_events(request: Request, token: Optional[str] = Query(None)):
+    """Stream ``stats`` and ``leaderboard`` events for the current user.
+
+    EventSource cannot set headers, so the access token may be passed as
+    ``?token=`` instead of an Authorization header. The first event is the
+    current stats snapshot; idle connections get a comment every
+    SSE_HEARTBEAT_SECONDS.
+    """
+    if token is None:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+    # The lookup is blocking database work; keep it off the event loop
+    user = await run_in_threadpool(_user_from_token, token)
+    return StreamingResponse(
+        event_stream(
+            [user_topic(user.id), "leaderboard"],
+            settings.SSE_HEARTBEAT_SECONDS,
+            initial=[("stats", user_stats(user))],
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
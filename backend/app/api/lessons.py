@@ -1,45 +1,58 @@
 """
 Lessons and levels endpoints.
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List
 
-from ..database import get_db
-from ..models.level import Level
+from ..database import get_db, get_read_db
 from ..models.lesson import Lesson
+from ..models.question import Question
+from ..models.user import User
+from ..catalog import QUESTION_COLUMNS, build_catalog, lesson_payload, lesson_questions, question_payload, versioned
+from ..compression import Precompressed
+from ..config import settings
+from ..sampling import attempt_token, question_pools, unmastered_misses
+from .progress import get_current_user
 
 router = APIRouter()
 
+def compressed_catalog() -> Precompressed:
+    """The catalog response body, encoded and compressed once per content version."""
+    return versioned("catalog.compressed", lambda db: Precompressed.json(build_catalog(db)))
+
 @router.get("/")
-def get_levels(db: Session = Depends(get_db)):
+def get_levels(request: Request):
     """Return all levels with their lessons."""
-    levels = db.query(Level).order_by(Level.order).all()
-    result = []
-    for level in levels:
-        lessons = db.query(Lesson).filter(Lesson.level_id == level.id).order_by(Lesson.order).all()
-        result.append({
-            "id": level.id,
-            "title": level.title,
-            "description": level.description,
-            "required_experience": level.required_experience,
-            "lessons": [
-                {
-                    "id": l.id,
-                    "title": l.title,
-                    "description": l.description,
-                    "type": l.type,
-                    "order": l.order,
-                    "content": l.content,
-                }
-                for l in lessons
-            ]
-        })
-    return result
+    return compressed_catalog().response(request)
 
 @router.get("/{lesson_id}")
-def get_lesson_detail(lesson_id: int, db: Session = Depends(get_db)):
+def get_lesson_detail(lesson_id: int, db: Session = Depends(get_read_db)):
     lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    return lesson
+    return lesson_payload(lesson, lesson_questions(db, lesson_id))
+
+@router.post("/{lesson_id}/start")
+def start_lesson(
+    lesson_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Draw this attempt's questions, favouring ones the user has missed.
+
+    Submit the returned attempt_token with the answers. Answers are not
+    included: the attempt is graded by /api/progress/grade.
+    """
+    pool = question_pools().for_lesson(lesson_id)
+    if pool is None:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    question_ids = pool.sample(settings.LESSON_SAMPLE_SIZE, unmastered_misses(db, current_user.id, lesson_id))
+    questions = db.query(*QUESTION_COLUMNS).filter(
+        Question.lesson_id == lesson_id, Question.question_id.in_(question_ids)
+    ).order_by(Question.position).all()
+    return {
+        "lesson_id": lesson_id,
+        "attempt_token": attempt_token(current_user.id, lesson_id, [q.question_id for q in questions]),
+        "questions": [question_payload(q, include_answer=False) for q in questions],
+    }
@@ -1,13 +1,16 @@
 """
 API for retrieving and managing wrong questions (mistake notebook).
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models.user import User
-from ..models.wrong_question import WrongQuestion
+from ..models.wrong_question import ArchivedWrongQuestion, WrongQuestion
+from ..models.lesson import Lesson
+from ..mistake_archive import archive_mistakes
 from ..api.auth import oauth2_scheme
+from ..api.progress import get_current_reader
 from jose import JWTError, jwt
 from ..config import settings
 from pydantic import BaseModel
@@ -53,8 +56,8 @@ class MarkMasteredRequest(BaseModel):
 
 @router.get("/", response_model=List[WrongQuestionResponse])
 def get_wrong_questions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Retrieve all wrong questions for the current user."""
     wrong_questions = db.query(WrongQuestion).filter(
@@ -62,11 +65,11 @@ def get_wrong_questions(
         WrongQuestion.mastered == False
     ).all()
     
-    # We need to get lesson titles
-    from ..models.lesson import Lesson
+    # Lesson titles, in one query
+    lesson_ids = {wq.lesson_id for wq in wrong_questions}
+    titles = dict(db.query(Lesson.id, Lesson.title).filter(Lesson.id.in_(lesson_ids))) if lesson_ids else {}
     result = []
     for wq in wrong_questions:
-        lesson = db.query(Lesson).filter(Lesson.id == wq.lesson_id).first()
         result.append(WrongQuestionResponse(
             id=wq.id,
             lesson_id=wq.lesson_id,
@@ -77,7 +80,7 @@ def get_wrong_questions(
             mastered=wq.mastered,
             created_at=wq.created_at,
             last_reviewed=wq.last_reviewed,
-            lesson_title=lesson.title if lesson else None
+            lesson_title=titles.get(wq.lesson_id)
         ))
     return result
 
@@ -97,6 +100,47 @@ def mark_as_mastered(
     
     wrong_question.mastered = True
     wrong_question.last_reviewed = datetime.now()
+    if settings.MISTAKE_ARCHIVE_AGE_DAYS == 0:
+        # Stamp the new sync version before the row moves
+        db.flush()
+        archive_mistakes(db, WrongQuestion.__table__.c.id == wrong_question.id)
     db.commit()
     
     return {"message": "Question marked as mastered"}
+
+@router.get("/mastered", response_model=List[WrongQuestionResponse])
+def get_mastered_questions(
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
+):
+    """Mastered questions, newest first, including archived ones.
+
+    Pass the last id returned as ``before_id`` to get the next page.
+    """
+    entries = []
+    for model in (WrongQuestion, ArchivedWrongQuestion):
+        query = db.query(model).filter(model.user_id == current_user.id, model.mastered == True)
+        if before_id is not None:
+            query = query.filter(model.id < before_id)
+        entries.extend(query.order_by(model.id.desc()).limit(limit))
+    entries = sorted(entries, key=lambda wq: wq.id, reverse=True)[:limit]
+
+    lesson_ids = {wq.lesson_id for wq in entries}
+    titles = dict(db.query(Lesson.id, Lesson.title).filter(Lesson.id.in_(lesson_ids))) if lesson_ids else {}
+    return [
+        WrongQuestionResponse(
+            id=wq.id,
+            lesson_id=wq.lesson_id,
+            question_id=wq.question_id,
+            question_text=wq.question_text,
+            correct_answer=wq.correct_answer,
+            user_answer=wq.user_answer,
+            mastered=True,
+            created_at=wq.created_at,
+            last_reviewed=wq.last_reviewed,
+            lesson_title=titles.get(wq.lesson_id)
+        )
+        for wq in entries
+    ]
@@ -1,27 +1,33 @@
 """
 Progress tracking: submit lesson results, update user stats.
 """
-import json
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from datetime import datetime, timezone, timedelta
 
-from ..database import get_db
+from ..database import dialect_insert, get_db, get_read_db
 from ..models.user import User
 from ..models.lesson import Lesson
+from ..models.question import Question
 from ..models.user_progress import UserProgress
 from ..models.wrong_question import WrongQuestion
+from ..models.sync_tombstone import next_sync_version
 from ..api.auth import oauth2_scheme
 from jose import JWTError, jwt
 from ..config import settings
+from ..grading import answer_keys, grade
+from ..question_stats import QuestionStatsBatch
+from ..idempotency import idempotent
+from ..events import leaderboard_changed, publish_user_stats
+from .. import tasks
+from ..activity import add_to_rollups, record_activity
+from ..lesson_index import completed_bits, lesson_sequence, mark_completed
+from ..sampling import attempt_claims, consume_attempt
 
 router = APIRouter()
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+def _user_for_token(token: str, db: Session) -> User:
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -39,67 +45,131 @@ def get_current_user(
         raise credentials_exception
     return user
 
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    return _user_for_token(token, db)
+
+def get_current_reader(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_read_db)
+):
+    """get_current_user for read-only endpoints: looked up through get_read_db, so on a replica
+    unless the user wrote recently. Endpoints also depending on get_read_db share the session."""
+    return _user_for_token(token, db)
+
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class ProgressSubmit(BaseModel):
     lesson_id: int
     score: int
     hearts_lost: int = 0
     wrong_question_ids: Optional[List[int]] = None
+    seconds_spent: int = 0
+    attempt_token: Optional[str] = None
 
-@router.post("/submit")
-def submit_lesson_result(
-    data: ProgressSubmit,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+class AnswerSubmission(BaseModel):
+    question_id: int
+    answer: str
+
+class AttemptSubmit(BaseModel):
+    lesson_id: int
+    answers: List[AnswerSubmission]
+    seconds_spent: int = 0
+    attempt_token: Optional[str] = None
+
+class GradeSubmit(BaseModel):
+    attempts: List[AttemptSubmit]
+
+def attempt_questions(db: Session, token: Optional[str], user_id: int, lesson_id: int) -> Optional[List[int]]:
+    """Question ids served for this attempt, or None for a legacy submission without a token.
+
+    The token is used up with the request's transaction.
+    """
+    if token is None:
+        if settings.REQUIRE_ATTEMPT_TOKEN:
+            raise HTTPException(status_code=400, detail="attempt_token is required; start the lesson first")
+        return None
+    claims = attempt_claims(token, user_id, lesson_id)
+    if claims is None:
+        raise HTTPException(status_code=400, detail="Invalid or expired attempt token")
+    consume_attempt(db, user_id, claims)
+    return claims.get("q")
+
+def record_mistakes(db: Session, user_id: int, lesson_id: int, wrong_answers: Dict[int, str]):
+    """Add missed questions to the user's notebook.
+
+    ``wrong_answers`` maps missed question ids to the answer given.
+    """
+    if not wrong_answers:
+        return
+    wrong_question_ids = list(wrong_answers)
+    # Only the missed questions are loaded, via the (lesson_id, question_id) index
+    questions = db.query(Question).filter(
+        Question.lesson_id == lesson_id,
+        Question.question_id.in_(wrong_question_ids)
+    ).all()
+    if not questions:
+        return
+    # A Core insert bypasses the flush listener, so take the sync version here
+    version = next_sync_version(db, user_id)
+    # Questions already in the notebook, even ones a concurrent submission is adding, are skipped
+    # by the unique (user_id, lesson_id, question_id) index
+    db.execute(
+        dialect_insert(db, WrongQuestion.__table__).on_conflict_do_nothing(
+            index_elements=["user_id", "lesson_id", "question_id"]
+        ),
+        [
+            {
+                "user_id": user_id,
+                "lesson_id": lesson_id,
+                "question_id": question.question_id,
+                "question_text": question.prompt,
+                "correct_answer": question.answer,
+                "user_answer": wrong_answers[question.question_id],
+                "mastered": False,
+                "sync_version": version,
+            }
+            for question in questions
+        ],
+    )
+
+@tasks.handler("lesson_attempts")
+def process_lesson_attempts(db: Session, user_id: int, payload: dict):
+    """Background half of a submission: notebook entries, question stats and global activity."""
+    stats = QuestionStatsBatch()
+    keys = answer_keys()
+    for attempt in payload["attempts"]:
+        lesson_id = attempt["lesson_id"]
+        # JSON object keys are strings
+        wrong = {int(qid): answer for qid, answer in attempt["wrong"].items()}
+        answers = {int(qid): answer for qid, answer in (attempt.get("answers") or {}).items()}
+        record_mistakes(db, user_id, lesson_id, wrong)
+        # Later attempts at the same lesson must see this one's rows
+        db.flush()
+        # Sampled attempts count only the questions served
+        asked = attempt.get("served") or keys.for_lesson(lesson_id) or ()
+        stats.add_attempt(lesson_id, asked, wrong, answers)
+    # Question stats and rollups are shared tables
+    tasks.defer_shared(db, stats.write)
+    if payload.get("activity"):
+        tasks.defer_shared(db, lambda shared: add_to_rollups(shared, payload["activity"]))
+
+def record_attempt(
+    db: Session,
+    current_user: User,
+    lesson_id: int,
+    score: int,
+    hearts_lost: int,
 ):
-    """Record a lesson attempt and update user stats."""
-    lesson_id = data.lesson_id
-    score = data.score
-    hearts_lost = data.hearts_lost
-    wrong_question_ids = data.wrong_question_ids or []
-    
-    # 1. Find lesson
-    lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-    
-    # Parse lesson content to get question details
-    lesson_content = []
-    try:
-        lesson_content = json.loads(lesson.content)
-    except:
-        pass
-    
-    # 2. Save wrong questions
-    for qid in wrong_question_ids:
-        # Find the question in lesson content
-        question_data = None
-        for q in lesson_content:
-            if q.get("id") == qid:
-                question_data = q
-                break
-        if question_data:
-            # Check if this wrong question already exists for the user
-            existing = db.query(WrongQuestion).filter(
-                WrongQuestion.user_id == current_user.id,
-                WrongQuestion.lesson_id == lesson_id,
-                WrongQuestion.question_id == qid
-            ).first()
-            if not existing:
-                wrong_q = WrongQuestion(
-                    user_id=current_user.id,
-                    lesson_id=lesson_id,
-                    question_id=qid,
-                    question_text=question_data.get("question", ""),
-                    correct_answer=question_data.get("answer", ""),
-                    user_answer="",  # We don't track the specific wrong answer in this implementation
-                    mastered=False
-                )
-                db.add(wrong_q)
-    
-    # 3. Create or update progress
+    """Apply one lesson attempt to the user's progress and stats.
+
+    Returns (experience gained, coins gained); the caller commits.
+    Mistakes and question stats are recorded by process_lesson_attempts.
+    """
+    # 1. Create or update progress
     progress = db.query(UserProgress).filter(
         and_(UserProgress.user_id == current_user.id,
              UserProgress.lesson_id == lesson_id)
@@ -116,10 +186,11 @@ def submit_lesson_result(
     progress.attempts += 1
     if score > progress.best_score:
         progress.best_score = score
-        if score >= 80:   # threshold for completion
+        if score >= 80 and not progress.completed:   # threshold for completion
             progress.completed = True
+            mark_completed(db, current_user, lesson_id)
     
-    # 4. Update user stats
+    # 2. Update user stats
     # Add experience (score/10)
     exp_gained = max(1, score // 10)
     
@@ -143,7 +214,7 @@ def submit_lesson_result(
     coin_gained = score // 5
     current_user.coins += coin_gained
     
-    # 5. Update streak
+    # 3. Update streak
     now = datetime.now(timezone.utc)
     if current_user.last_lesson_at:
         last_date = current_user.last_lesson_at.date()
@@ -160,26 +231,155 @@ def submit_lesson_result(
         
     current_user.last_lesson_at = now
     
-    db.commit()
-    db.refresh(current_user)
-    
+    return exp_gained, coin_gained
+
+def user_stats(user: User) -> dict:
     return {
-        "message": "Progress saved",
-        "experience_gained": exp_gained,
-        "coins_gained": coin_gained,
-        "user": {
-            "level": current_user.level,
-            "experience": current_user.experience,
-            "hearts": current_user.hearts,
-            "max_hearts": current_user.max_hearts,
-            "coins": current_user.coins,
-        }
+        "level": user.level,
+        "experience": user.experience,
+        "hearts": user.hearts,
+        "max_hearts": user.max_hearts,
+        "coins": user.coins,
     }
 
-@router.get("/")
-def get_user_progress(
+@router.post("/submit")
+def submit_lesson_result(
+    data: ProgressSubmit,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Record a lesson attempt and update user stats."""
+    with idempotent(db, current_user.id, idempotency_key, "progress.submit", data) as request:
+        if request.replayed is not None:
+            return request.replayed
+        
+        lesson = db.query(Lesson).filter(Lesson.id == data.lesson_id).first()
+        if not lesson:
+            raise HTTPException(status_code=404, detail="Lesson not found")
+        served = attempt_questions(db, data.attempt_token, current_user.id, data.lesson_id)
+        if served is not None and not set(data.wrong_question_ids or ()) <= set(served):
+            raise HTTPException(status_code=400, detail="wrong_question_ids must be among the questions served")
+        
+        exp_gained, coin_gained = record_attempt(
+            db, current_user, data.lesson_id, data.score, data.hearts_lost
+        )
+        
+        wrong = {qid: "" for qid in data.wrong_question_ids or []}
+        activity = record_activity(
+            db, current_user.id, exp_gained, 1, data.seconds_spent, len(wrong)
+        )
+        
+        # The client does not report which answer it gave
+        tasks.enqueue(db, current_user.id, "lesson_attempts", {
+            "attempts": [{"lesson_id": data.lesson_id, "wrong": wrong, "served": served}],
+            "activity": activity,
+        })
+        
+        response = request.commit({
+            "message": "Progress saved",
+            "experience_gained": exp_gained,
+            "coins_gained": coin_gained,
+            "user": user_stats(current_user),
+        })
+        publish_user_stats(request.user_id, response["user"])
+        leaderboard_changed()
+        return response
+
+@router.post("/grade")
+def grade_lesson_attempts(
+    data: GradeSubmit,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Grade raw answers server-side and record each attempt.
+
+    Score, hearts lost and the missed questions are derived from the answer
+    key; one wrong answer costs one heart. All attempts are saved together.
+    """
+    with idempotent(db, current_user.id, idempotency_key, "progress.grade", data) as request:
+        if request.replayed is not None:
+            return request.replayed
+        
+        keys = answer_keys()
+        graded = []
+        for attempt in data.attempts:
+            key = keys.for_lesson(attempt.lesson_id)
+            if key is None:
+                raise HTTPException(status_code=404, detail=f"Lesson {attempt.lesson_id} not found")
+            served = attempt_questions(db, attempt.attempt_token, current_user.id, attempt.lesson_id)
+            if served is not None:
+                # Only the questions actually asked count
+                key = {question_id: key[question_id] for question_id in served if question_id in key}
+            answers = {a.question_id: a.answer for a in attempt.answers if a.question_id in key}
+            graded.append((attempt.lesson_id, key, served, answers, grade(key, answers.items())))
+        
+        results = []
+        followup = []
+        for lesson_id, key, served, answers, result in graded:
+            exp_gained, coin_gained = record_attempt(
+                db, current_user, lesson_id, result.score, len(result.wrong)
+            )
+            # Later attempts at the same lesson must see this one's rows
+            db.flush()
+            followup.append({"lesson_id": lesson_id, "wrong": result.wrong, "answers": answers, "served": served})
+            results.append({
+                "lesson_id": lesson_id,
+                "score": result.score,
+                "correct": result.correct,
+                "total": result.total,
+                "wrong_question_ids": sorted(result.wrong),
+                "experience_gained": exp_gained,
+                "coins_gained": coin_gained,
+            })
+        activity = record_activity(
+            db, current_user.id,
+            xp=sum(r["experience_gained"] for r in results),
+            lessons=len(results),
+            seconds=sum(a.seconds_spent for a in data.attempts),
+            mistakes=sum(len(r["wrong_question_ids"]) for r in results),
+        )
+        tasks.enqueue(db, current_user.id, "lesson_attempts", {"attempts": followup, "activity": activity})
+        
+        response = request.commit({
+            "message": "Progress saved",
+            "results": results,
+            "user": user_stats(current_user),
+        })
+        publish_user_stats(request.user_id, response["user"])
+        leaderboard_changed()
+        return response
+
+@router.get("/next")
+def get_next_lesson(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
+):
+    """The first incomplete lesson in an unlocked level, in curriculum order.
+
+    ``lesson`` is null when every unlocked lesson is complete.
+    """
+    sequence = lesson_sequence()
+    bits = completed_bits(db, current_user, sequence)
+    if db.is_modified(current_user):
+        # The bitmap was missing or encoded against an older catalog
+        db.commit()
+    position = sequence.next_position(bits, current_user.experience)
+    lesson = None
+    if position is not None:
+        lesson_id, level_id, title = sequence.lessons[position]
+        lesson = {"id": lesson_id, "level_id": level_id, "title": title}
+    return {
+        "lesson": lesson,
+        "completed_lessons": bits.bit_count(),
+        "total_lessons": len(sequence),
+    }
+
+@router.get("/")
+def get_user_progress(
+    current_user: User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """Return all progress entries for the current user."""
     progress = db.query(UserProgress).filter(
@@ -0,0 +1,39 @@
+"""
+Curriculum search.
+"""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.search import KINDS, search_index
+
+router = APIRouter()
+
+
+@router.get("/")
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+):
+    """Levels, lessons and questions matching every word of ``q``, best first; the last word may be a prefix."""
+    if kind is not None and kind not in KINDS:
+        raise HTTPException(status_code=400, detail="Kind must be level, lesson or question")
+    total, hits = search_index().search(q, kind=kind, limit=limit, offset=offset)
+    return {
+        "query": q,
+        "total": total,
+        "results": [
+            {
+                "kind": doc_kind,
+                "level_id": level_id,
+                "lesson_id": lesson_id,
+                "question_id": question_id,
+                "title": title,
+                "text": text,
+                "score": round(score, 3),
+            }
+            for score, (doc_kind, level_id, lesson_id, question_id, title, text) in hits
+        ],
+    }
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 
 from app.database import get_db
 from app.models.user import User
-from app.api.progress import get_current_user
+from app.api.progress import get_current_user, user_stats
+from app.events import publish_user_stats
+from app.idempotency import idempotent
 
 router = APIRouter()
 
@@ -40,36 +42,41 @@ def get_shop_items():
 def buy_item(
     request: BuyRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
     """Purchase a shop item for the current user."""
-    # Find the requested item
-    item = next((it for it in SHOP_ITEMS if it["id"] == request.item_id), None)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-
-    # Check if the user has enough coins
-    if current_user.coins < item["price"]:
-        raise HTTPException(status_code=400, detail="Not enough coins")
-
-    # Deduct the price
-    current_user.coins -= item["price"]
-
-    # Apply the item effect
-    if item["type"] == "heart":
-        current_user.max_hearts += 1
-        current_user.hearts = current_user.max_hearts  # refill hearts
-    elif item["type"] == "coins":
-        current_user.coins += 100  # grant 100 coins (net effect: -price +100)
-    elif item["type"] == "boost":
-        # Double XP for 30 minutes
-        current_user.boost_expires_at = datetime.now(timezone.utc) + timedelta(minutes=30)
-
-    db.commit()
-    db.refresh(current_user)
-
-    return {
-        "message": f"Purchased {item['name']} successfully",
-        "remaining_coins": current_user.coins,
-        "max_hearts": current_user.max_hearts,
-    }
+    with idempotent(db, current_user.id, idempotency_key, "shop.buy", request) as purchase:
+        if purchase.replayed is not None:
+            return purchase.replayed
+
+        # Find the requested item
+        item = next((it for it in SHOP_ITEMS if it["id"] == request.item_id), None)
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+
+        # Check if the user has enough coins
+        if current_user.coins < item["price"]:
+            raise HTTPException(status_code=400, detail="Not enough coins")
+
+        # Deduct the price
+        current_user.coins -= item["price"]
+
+        # Apply the item effect
+        if item["type"] == "heart":
+            current_user.max_hearts += 1
+            current_user.hearts = current_user.max_hearts  # refill hearts
+        elif item["type"] == "coins":
+            current_user.coins += 100  # grant 100 coins (net effect: -price +100)
+        elif item["type"] == "boost":
+            # Double XP for 30 minutes
+            current_user.boost_expires_at = datetime.now(timezone.utc) + timedelta(minutes=30)
+
+        stats = user_stats(current_user)
+        response = purchase.commit({
+            "message": f"Purchased {item['name']} successfully",
+            "remaining_coins": current_user.coins,
+            "max_hearts": current_user.max_hearts,
+        })
+        publish_user_stats(purchase.user_id, stats)
+        return response
@@ -0,0 +1,96 @@
+"""
+Delta sync: everything that changed for the current user since a version.
+"""
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.orm import Session
+
+from app.api.progress import get_current_user
+from app.database import get_db
+from app.models.lesson import Lesson
+from app.models.sync_tombstone import SyncTombstone
+from app.models.user import User
+from app.models.user_progress import UserProgress
+from app.models.wrong_question import WrongQuestion
+
+router = APIRouter()
+
+
+@router.get("/")
+def sync_changes(
+    since: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Return profile, progress and mistakes changed after ``since``.
+
+    Responds 304 with no body when nothing changed, which costs no queries
+    beyond authentication. Mastered or deleted items are listed in
+    ``removed``. Pass the returned ``version`` as ``since`` next time.
+    Reads go to the primary so rows are never behind the version.
+
+    Deletions are only listed for SYNC_TOMBSTONE_RETENTION_DAYS. When
+    ``since`` is older than that, the response is the full state with
+    ``full`` set, and the client replaces what it has instead of merging.
+    """
+    version = current_user.sync_version
+    if since >= version:
+        return Response(status_code=304)
+    if since < current_user.sync_floor:
+        since = 0
+
+    progress = db.query(UserProgress).filter(UserProgress.user_id == current_user.id)
+    changed_mistakes = db.query(WrongQuestion).filter(WrongQuestion.user_id == current_user.id)
+    if since:
+        progress = progress.filter(UserProgress.sync_version > since)
+        changed_mistakes = changed_mistakes.filter(WrongQuestion.sync_version > since)
+        tombstones = db.query(SyncTombstone).filter(
+            SyncTombstone.user_id == current_user.id,
+            SyncTombstone.sync_version > since,
+        ).all()
+    else:
+        tombstones = []
+    progress = progress.all()
+    changed_mistakes = changed_mistakes.all()
+
+    mistakes = [wq for wq in changed_mistakes if not wq.mastered]
+    lesson_ids = {wq.lesson_id for wq in mistakes}
+    titles = dict(db.query(Lesson.id, Lesson.title).filter(Lesson.id.in_(lesson_ids))) if lesson_ids else {}
+
+    return {
+        "version": version,
+        "full": not since,
+        "profile": {
+            "id": current_user.id,
+            "username": current_user.username,
+            "email": current_user.email,
+            "level": current_user.level,
+            "experience": current_user.experience,
+            "coins": current_user.coins,
+            "hearts": current_user.hearts,
+            "max_hearts": current_user.max_hearts,
+            "avatar_url": current_user.avatar_url,
+            "boost_expires_at": current_user.boost_expires_at,
+            "streak_count": current_user.streak_count,
+        },
+        "progress": progress,
+        "mistakes": [
+            {
+                "id": wq.id,
+                "lesson_id": wq.lesson_id,
+                "question_id": wq.question_id,
+                "question_text": wq.question_text,
+                "correct_answer": wq.correct_answer,
+                "user_answer": wq.user_answer,
+                "mastered": wq.mastered,
+                "created_at": wq.created_at,
+                "last_reviewed": wq.last_reviewed,
+                "lesson_title": titles.get(wq.lesson_id),
+            }
+            for wq in mistakes
+        ],
+        "removed": [
+            {"kind": "mistake", "id": wq.id} for wq in changed_mistakes if wq.mastered
+        ] + [
+            {"kind": t.kind, "id": t.row_id} for t in tombstones
+        ],
+    }
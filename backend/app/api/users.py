@@ -3,7 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app import sharding
+from app.database import get_db, get_read_db
 from app.models.user import User
 from app.api.progress import get_current_user
 
@@ -37,10 +38,11 @@ def read_user_profile(
     }
 
 
-@router.get("/leaderboard")
-def get_leaderboard(db: Session = Depends(get_db)):
-    """Return top users by experience."""
-    top_users = db.query(User).order_by(User.experience.desc()).limit(10).all()
+def leaderboard_entries(db: Session) -> list:
+    if sharding.is_enabled():
+        top_users = sharding.top_users(10)
+    else:
+        top_users = db.query(User).order_by(User.experience.desc()).limit(10).all()
     return [
         {
             "id": u.id,
@@ -53,6 +55,12 @@ def get_leaderboard(db: Session = Depends(get_db)):
     ]
 
 
+@router.get("/leaderboard")
+def get_leaderboard(db: Session = Depends(get_read_db)):
+    """Return top users by experience."""
+    return leaderboard_entries(db)
+
+
 @router.put("/me")
 def update_user_profile(
     update_data: UserUpdate,
@@ -60,15 +68,19 @@ def update_user_profile(
     db: Session = Depends(get_db)
 ):
     """Update the current user's profile (username and/or email)."""
+    old_email = current_user.email
     if update_data.username is not None:
         current_user.username = update_data.username
 
     if update_data.email is not None:
         # Ensure the new email is not already taken by another user
-        existing = db.query(User).filter(
-            User.email == update_data.email,
-            User.id != current_user.id
-        ).first()
+        if sharding.is_enabled():
+            existing = sharding.directory_conflict(db, update_data.email, None, exclude_id=current_user.id)
+        else:
+            existing = db.query(User).filter(
+                User.email == update_data.email,
+                User.id != current_user.id
+            ).first()
         if existing:
             raise HTTPException(
                 status_code=400,
@@ -79,6 +91,12 @@ def update_user_profile(
     if update_data.avatar_url is not None:
         current_user.avatar_url = update_data.avatar_url
 
+    if sharding.is_enabled():
+        sharding.update_directory(
+            db, current_user.id, old_email,
+            email=current_user.email, username=current_user.username,
+        )
+
     db.commit()
     db.refresh(current_user)
 
@@ -0,0 +1,257 @@
+"""
+Versioned offline content bundles, one per level, with binary deltas.
+
+A level's bundle is its catalog entry as JSON, laid out one lesson per line.
+Bundles are named by a hash of their content, so a level that did not
+change keeps its bundle across content versions. The manifest for a content
+version lists every level's bundle hash; a client downloads only the levels
+whose hash differs from what it has.
+
+For levels that changed since one of the previous BUNDLE_DELTA_VERSIONS
+versions, the manifest also offers deltas from the earlier bundle. A delta
+is a sequence of operations that rebuild the new bundle from the old one:
+
+    b"EQD1" varint(new length) op*
+    op: 0x00 varint(offset) varint(length)   copy bytes of the old bundle
+        0x01 varint(length) bytes            insert bytes
+
+Bundles, deltas and manifests are written gzip-compressed under BUNDLE_DIR
+once per content version (the first process to notice a new version builds
+them under a file lock) and served from disk.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .catalog import build_catalog, versioned
+from .config import settings
+from .models.content_version import current_version
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DELTA_MAGIC = b"EQD1"
+COPY, INSERT = 0, 1
+HASH = re.compile(r"[0-9a-f]{32}")
+# Delta granularity: lines (lessons) and questions within a lesson's content
+_CHUNK_END = re.compile(rb"(?<=\n)|(?<=\}, )")
+
+
+def bundle_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def level_bundle(level: dict) -> bytes:
+    """A catalog level as JSON, one lesson per line."""
+    header = json.dumps({key: value for key, value in level.items() if key != "lessons"}, separators=(",", ":"))
+    lessons = ",\n".join(json.dumps(lesson, separators=(",", ":")) for lesson in level["lessons"])
+    return f'{header[:-1]},"lessons":[\n{lessons}\n]}}'.encode()
+
+
+def _varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def make_delta(old: bytes, new: bytes) -> bytes:
+    old_chunks = _CHUNK_END.split(old)
+    new_chunks = _CHUNK_END.split(new)
+    offsets = [0, *accumulate(len(chunk) for chunk in old_chunks)]
+    delta = bytearray(DELTA_MAGIC)
+    _varint(delta, len(new))
+    matcher = SequenceMatcher(None, old_chunks, new_chunks, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(COPY)
+            _varint(delta, offsets[i1])
+            _varint(delta, offsets[i2] - offsets[i1])
+        elif j2 > j1:
+            inserted = b"".join(new_chunks[j1:j2])
+            delta.append(INSERT)
+            _varint(delta, len(inserted))
+            delta += inserted
+    return bytes(delta)
+
+
+def apply_delta(old: bytes, delta: bytes) -> bytes:
+    """Rebuild a bundle; the reference for client implementations."""
+    if delta[:4] != DELTA_MAGIC:
+        raise ValueError("Not a bundle delta")
+    length, pos = _read_varint(delta, 4)
+    out = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        if op == COPY:
+            offset, pos = _read_varint(delta, pos + 1)
+            size, pos = _read_varint(delta, pos)
+            out += old[offset:offset + size]
+        elif op == INSERT:
+            size, pos = _read_varint(delta, pos + 1)
+            out += delta[pos:pos + size]
+            pos += size
+        else:
+            raise ValueError("Unknown delta operation")
+    if len(out) != length:
+        raise ValueError("Delta does not match the bundle")
+    return bytes(out)
+
+
+def _root() -> Path:
+    return Path(settings.BUNDLE_DIR)
+
+
+def object_path(digest: str) -> Path:
+    return _root() / "objects" / f"{digest}.json.gz"
+
+
+def delta_path(old: str, new: str) -> Path:
+    return _root() / "deltas" / f"{old}-{new}.delta.gz"
+
+
+def _manifest_path(version: int) -> Path:
+    return _root() / "manifests" / f"{version}.json"
+
+
+def _write(path: Path, data: bytes):
+    """Write gzip-compressed, atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.{os.getpid()}")
+    temporary.write_bytes(gzip.compress(data, compresslevel=settings.PRECOMPRESS_GZIP_LEVEL, mtime=0))
+    os.replace(temporary, path)
+
+
+def _read(path: Path) -> bytes:
+    return gzip.decompress(path.read_bytes())
+
+
+def _manifest_versions() -> List[int]:
+    directory = _root() / "manifests"
+    if not directory.is_dir():
+        return []
+    return sorted(int(path.stem) for path in directory.glob("*.json") if path.stem.isdigit())
+
+
+def _load_manifest(version: int) -> Optional[dict]:
+    path = _manifest_path(version)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+@contextmanager
+def _generation_lock() -> Iterator[None]:
+    """Serialize builds across processes.
+
+    Without fcntl there is no lock: every file is content-addressed and
+    written by atomic replace, so racing builds only duplicate work.
+    """
+    if fcntl is None:
+        yield
+        return
+    _root().mkdir(parents=True, exist_ok=True)
+    with open(_root() / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_bundles(db: Session, version: int) -> dict:
+    """Write the bundles, deltas and manifest for ``version``; the caller holds the generation lock."""
+    previous = [
+        manifest for manifest in (_load_manifest(v) for v in _manifest_versions() if v < version)
+        if manifest is not None
+    ][-settings.BUNDLE_DELTA_VERSIONS:] if settings.BUNDLE_DELTA_VERSIONS else []
+    earlier_hashes = [{level["level_id"]: level["hash"] for level in manifest["levels"]} for manifest in previous]
+
+    levels = []
+    for level in build_catalog(db):
+        data = level_bundle(level)
+        digest = bundle_hash(data)
+        path = object_path(digest)
+        if not path.exists():
+            _write(path, data)
+        compressed_size = path.stat().st_size
+
+        deltas = {}
+        for hashes in reversed(earlier_hashes):
+            old = hashes.get(level["id"])
+            if old is None or old == digest or old in deltas or not object_path(old).exists():
+                continue
+            target = delta_path(old, digest)
+            if not target.exists():
+                _write(target, make_delta(_read(object_path(old)), data))
+            if target.stat().st_size < compressed_size:
+                deltas[old] = target.stat().st_size
+        levels.append({
+            "level_id": level["id"],
+            "title": level["title"],
+            "hash": digest,
+            "size": len(data),
+            "compressed_size": compressed_size,
+            "deltas": deltas,
+        })
+
+    manifest = {"version": version, "levels": levels}
+    path = _manifest_path(version)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.{os.getpid()}")
+    temporary.write_text(json.dumps(manifest))
+    os.replace(temporary, path)
+    _prune(previous + [manifest])
+    return manifest
+
+
+def _prune(kept: List[dict]):
+    """Remove manifests older than the delta window and files no kept manifest refers to."""
+    versions = {manifest["version"] for manifest in kept}
+    referenced = {level["hash"] for manifest in kept for level in manifest["levels"]}
+    for version in _manifest_versions():
+        if version not in versions and version < max(versions):
+            _manifest_path(version).unlink(missing_ok=True)
+    for path in (_root() / "objects").glob("*.json.gz"):
+        if path.name.split(".")[0] not in referenced:
+            path.unlink(missing_ok=True)
+    for path in (_root() / "deltas").glob("*.delta.gz"):
+        old, _, new = path.name.split(".")[0].partition("-")
+        if old not in referenced or new not in referenced:
+            path.unlink(missing_ok=True)
+
+
+def _current_manifest(db: Session) -> dict:
+    version = current_version()
+    manifest = _load_manifest(version)
+    if manifest is not None:
+        return manifest
+    with _generation_lock():
+        # Another process may have built it while we waited
+        return _load_manifest(version) or build_bundles(db, version)
+
+
+def bundle_manifest() -> dict:
+    return versioned("bundles.manifest", _current_manifest)
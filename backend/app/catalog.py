@@ -0,0 +1,142 @@
+"""
+Lesson catalog assembly from the levels, lessons and questions tables.
+"""
+import json
+import threading
+from itertools import groupby
+from typing import Callable, Iterable, List, TypeVar
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models.content_version import current_version
+from .models.level import Level
+from .models.lesson import Lesson
+from .models.question import Question
+
+
+T = TypeVar("T")
+
+# name -> (content version, value)
+_versioned = {}
+_versioned_lock = threading.Lock()
+
+
+def versioned(name: str, build: Callable[[Session], T]) -> T:
+    """Return a per-process value built from the catalog, rebuilt when its content version changes."""
+    version = current_version()
+    with _versioned_lock:
+        entry = _versioned.get(name)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    db = SessionLocal()
+    try:
+        value = build(db)
+    finally:
+        db.close()
+    with _versioned_lock:
+        _versioned[name] = (version, value)
+    return value
+
+
+# Plain column rows are much cheaper to load than Question entities
+QUESTION_COLUMNS = (
+    Question.lesson_id, Question.question_id, Question.prompt, Question.options, Question.answer,
+)
+
+
+def question_payload(q, include_answer: bool = True) -> dict:
+    """A question in the shape clients expect inside a lesson's content."""
+    payload = {
+        "id": q.question_id,
+        "question": q.prompt,
+        "options": json.loads(q.options or "[]"),
+    }
+    if include_answer:
+        payload["answer"] = q.answer
+    return payload
+
+
+def content_json(questions: Iterable) -> str:
+    return json.dumps([question_payload(q) for q in questions])
+
+
+def lesson_questions(db: Session, lesson_id: int) -> list:
+    return db.query(*QUESTION_COLUMNS).filter(
+        Question.lesson_id == lesson_id
+    ).order_by(Question.position).all()
+
+
+def lesson_payload(lesson: Lesson, questions: Iterable) -> dict:
+    return {
+        "id": lesson.id,
+        "level_id": lesson.level_id,
+        "title": lesson.title,
+        "description": lesson.description,
+        "type": lesson.type,
+        "order": lesson.order,
+        "content": content_json(questions),
+    }
+
+
+def build_catalog(db: Session) -> List[dict]:
+    """All levels with their lessons and questions, in three queries."""
+    levels = db.query(Level).order_by(Level.order).all()
+    lessons = db.query(Lesson).order_by(Lesson.level_id, Lesson.order).all()
+    questions = db.query(*QUESTION_COLUMNS).order_by(Question.lesson_id, Question.position).all()
+
+    questions_by_lesson = {
+        lesson_id: list(rows) for lesson_id, rows in groupby(questions, key=lambda q: q.lesson_id)
+    }
+    lessons_by_level = {
+        level_id: list(rows) for level_id, rows in groupby(lessons, key=lambda l: l.level_id)
+    }
+    return [
+        {
+            "id": level.id,
+            "title": level.title,
+            "description": level.description,
+            "required_experience": level.required_experience,
+            "lessons": [
+                lesson_payload(l, questions_by_lesson.get(l.id, []))
+                for l in lessons_by_level.get(level.id, [])
+            ],
+        }
+        for level in levels
+    ]
+
+
+def questions_from_content(lesson_id: int, items: list) -> List[Question]:
+    """Question rows for a list of legacy content dicts."""
+    return [
+        Question(
+            lesson_id=lesson_id,
+            question_id=item.get("id", position + 1),
+            position=position,
+            prompt=item.get("question", ""),
+            options=json.dumps(item.get("options", [])),
+            answer=item.get("answer", ""),
+        )
+        for position, item in enumerate(items)
+    ]
+
+
+def unpack_lesson_content(db: Session, clear_content: bool = False) -> int:
+    """Move questions out of Lesson.content for lessons that have no question rows.
+
+    Returns the number of lessons migrated. The caller commits.
+    """
+    migrated_ids = {row[0] for row in db.query(Question.lesson_id).distinct()}
+    migrated = 0
+    for lesson in db.query(Lesson).filter(Lesson.content != "").order_by(Lesson.id):
+        if lesson.id in migrated_ids:
+            continue
+        try:
+            items = json.loads(lesson.content)
+        except ValueError:
+            continue
+        db.add_all(questions_from_content(lesson.id, items))
+        if clear_content:
+            lesson.content = ""
+        migrated += 1
+    return migrated
@@ -0,0 +1,182 @@
+"""
+Response compression (gzip, and brotli when the package is installed).
+
+CompressionMiddleware compresses responses on the fly. Streaming bodies are
+flushed chunk by chunk, so exports still arrive progressively; event streams
+are never compressed. Payloads that many clients fetch unchanged, like the
+catalog, are compressed once with Precompressed and served from memory.
+"""
+import gzip
+import hashlib
+import json
+import zlib
+from typing import Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# In order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def accepted_encoding(accept_encoding: str, available: Sequence[str] = ENCODINGS) -> Optional[str]:
+    """The client's preferred encoding among ``available``, or None."""
+    qualities = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Compressor:
+    """Incremental compressor; flush() emits everything written so far."""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            # wbits 31: gzip container
+            self._zlib = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def flush(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        excluded_types: Sequence[str] = ("text/event-stream",),
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.excluded_types = tuple(excluded_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding is not None:
+                responder = _CompressionResponder(self, encoding, send)
+                await self.app(scope, receive, responder.send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether to compress
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            if (
+                "content-encoding" in headers
+                or headers.get("content-type", "").startswith(self.middleware.excluded_types)
+                or (not more_body and len(body) < self.middleware.minimum_size)
+            ):
+                self.passthrough = True
+                await self.downstream(start)
+                await self.downstream(message)
+                return
+            self.compressor = _Compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.compressor.finish(body)
+                headers["Content-Length"] = str(len(body))
+                await self.downstream(start)
+                await self.downstream({**message, "body": body})
+                return
+            await self.downstream(start)
+
+        if more_body:
+            body = self.compressor.flush(body)
+        else:
+            body = self.compressor.finish(body)
+        await self.downstream({**message, "body": body})
+
+
+class Precompressed:
+    """A response body stored in every supported encoding.
+
+    Build one per content version; response() picks the variant matching the
+    request's Accept-Encoding and answers If-None-Match with 304.
+    """
+
+    __slots__ = ("media_type", "etag", "variants")
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.media_type = media_type
+        # Weak, since the same validator covers every encoding
+        self.etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        self.variants = {
+            "identity": body,
+            "gzip": gzip.compress(body, settings.PRECOMPRESS_GZIP_LEVEL, mtime=0),
+        }
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=settings.PRECOMPRESS_BROTLI_QUALITY)
+
+    @classmethod
+    def json(cls, content) -> "Precompressed":
+        # Same encoding as FastAPI's JSONResponse
+        body = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+        return cls(body.encode("utf-8"))
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding"}
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        encoding = accepted_encoding(request.headers.get("accept-encoding", ""), ENCODINGS)
+        if encoding is None:
+            encoding = "identity"
+        else:
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
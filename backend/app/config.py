@@ -7,6 +7,87 @@ from typing import List
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./englishquest.db"
+    # Read replicas for read-only endpoints, e.g. ["sqlite:///./replica1.db"]
+    DATABASE_REPLICA_URLS: List[str] = []
+    # Seconds a user's reads stay on the primary after they write
+    REPLICA_STICKINESS_SECONDS: float = 5.0
+    # User-partitioned databases for user-owned tables; empty disables sharding
+    SHARD_DATABASE_URLS: List[str] = []
+    # Import path of the ShardRouter that assigns new user ids to shards
+    SHARD_ROUTER: str = "app.sharding:ModuloShardRouter"
+    # Seconds a user's shard assignment is cached per process
+    SHARD_DIRECTORY_CACHE_SECONDS: float = 30.0
+    # Extra seconds a rebalance waits, beyond the cache, for requests routed before a user was fenced
+    SHARD_MOVE_GRACE_SECONDS: float = 10.0
+
+    # Seconds between checks for catalog changes made by other processes
+    CATALOG_VERSION_CHECK_SECONDS: float = 5.0
+
+    # Idempotency-Key replay window and per-process cache size
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 60 * 60
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+
+    # Delta sync: deletions are listed this long; clients that sync less often get a full resync
+    SYNC_TOMBSTONE_RETENTION_DAYS: int = 30
+
+    # Server-sent events: idle heartbeat and leaderboard recheck intervals
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+    LEADERBOARD_PUSH_SECONDS: float = 2.0
+
+    # Background task pipeline
+    TASK_WORKERS: int = 2
+    TASK_QUEUE_SIZE: int = 10000
+    TASK_SWEEP_SECONDS: float = 5.0  # how often the outbox is rescanned
+    TASK_LEASE_SECONDS: float = 60.0  # a claimed task is retried after this
+    TASK_MAX_ATTEMPTS: int = 5
+    TASK_RETENTION_SECONDS: float = 24 * 60 * 60  # processed tasks are then deleted
+
+    # Response compression; smaller bodies are sent as-is
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_EXCLUDED_TYPES: List[str] = ["text/event-stream", "image/", "video/", "audio/"]
+    # Payloads compressed once per content version can afford the slowest settings
+    PRECOMPRESS_GZIP_LEVEL: int = 9
+    PRECOMPRESS_BROTLI_QUALITY: int = 9  # 11 is ~250x slower for ~10% smaller output
+
+    # Mastered mistakes reviewed longer ago than this move to the archive table;
+    # 0 archives them as soon as they are mastered
+    MISTAKE_ARCHIVE_AGE_DAYS: int = 30
+    MISTAKE_ARCHIVE_BATCH_SIZE: int = 1000
+    MISTAKE_ARCHIVE_PAUSE_SECONDS: float = 0.2  # between batches, to spare the primary
+
+    # Prefork server (python -m app.serve). Server-sent events do not cross workers:
+    # a stats event reaches only streams on the worker that handled the write, and
+    # each worker's leaderboard push only notices experience changed through it.
+    # Set SERVER_WORKERS to 1 where clients rely on /api/events/stream.
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 2
+    SERVER_BACKLOG: int = 2048
+    SERVER_MAX_REQUESTS: int = 0  # recycle a worker after this many requests; 0 never
+    SERVER_MAX_REQUESTS_JITTER: int = 0  # random extra per worker, so they don't restart together
+    SERVER_GRACEFUL_TIMEOUT: float = 30.0  # seconds to finish in-flight requests on shutdown
+
+    # Bulk enrollment: rows per conflict check and insert, and bcrypt processes (0: one per CPU)
+    ENROLL_CHUNK_SIZE: int = 1000
+    ENROLL_HASH_WORKERS: int = 0
+
+    # Near-duplicate questions: estimated Jaccard similarity of shingles to report, and questions per NumPy batch
+    CONTENT_AUDIT_THRESHOLD: float = 0.8
+    CONTENT_AUDIT_BATCH_SIZE: int = 500
+
+    # Lesson attempts: questions drawn per attempt, how much more likely the user's unmastered mistakes are,
+    # attempt token lifetime, and whether submissions must carry a token
+    LESSON_SAMPLE_SIZE: int = 10
+    LESSON_MISS_WEIGHT: float = 3.0
+    ATTEMPT_TOKEN_EXPIRE_MINUTES: int = 240
+    REQUIRE_ATTEMPT_TOKEN: bool = False
+
+    # Offline content bundles: where bundles, deltas and manifests are stored, and how many earlier
+    # content versions get deltas to the current one
+    BUNDLE_DIR: str = "./bundles"
+    BUNDLE_DELTA_VERSIONS: int = 5
     
     # JWT
     SECRET_KEY: str = "your-secret-key-change-in-production"
@@ -0,0 +1,287 @@
+"""
+Near-duplicate question detection with MinHash and LSH.
+
+A question's prompt and answer are normalized and cut into overlapping
+SHINGLE-byte shingles. Its MinHash signature holds, for each of NUM_PERM
+hash functions, the smallest hash over its shingles. The share of equal
+values in two signatures estimates the Jaccard similarity of the two
+shingle sets. Signatures are computed with NumPy, a batch of questions at a
+time.
+
+For LSH each signature is cut into BANDS bands of ROWS values. Questions
+that agree on a whole band share a bucket, which happens with high
+probability above ~0.7 similarity and rarely below. Only questions sharing a
+bucket are compared, so an audit is close to linear in the catalog size.
+
+Signatures and buckets are persisted in question_signatures and
+question_bands. They are refreshed for new or edited questions whenever the
+content version moves, so a lesson can be checked with index lookups.
+"""
+import hashlib
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, delete, insert
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models.content_version import current_version
+from .models.job_checkpoint import JobCheckpoint
+from .models.lesson import Lesson
+from .models.question import Question
+from .models.question_signature import QuestionBand, QuestionSignature
+from .search import tokenize
+
+SHINGLE = 5
+NUM_PERM = 128
+BANDS, ROWS = 16, 8
+# Buckets larger than this are checked against their first member only
+MAX_PAIRWISE = 64
+CHECKPOINT = "content_audit"
+
+# Fixed, so persisted signatures stay comparable
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.randint(0, 2**63, NUM_PERM, dtype=np.uint64)
+_BAND_MULT = _rng.randint(1, 2**63, ROWS, dtype=np.uint64) | np.uint64(1)
+_SHINGLE_SHIFTS = np.arange(SHINGLE, dtype=np.uint64) * np.uint64(8)
+
+Key = Tuple[int, int]  # (lesson_id, question_id)
+
+
+def normalized_text(prompt: str, answer: str) -> bytes:
+    return (" ".join(tokenize(prompt)) + " | " + " ".join(tokenize(answer))).encode()
+
+
+def digest(text: bytes) -> str:
+    return hashlib.blake2b(text, digest_size=8).hexdigest()
+
+
+def signatures(texts: Sequence[bytes]) -> np.ndarray:
+    """MinHash signatures, one row of NUM_PERM uint32 per text."""
+    texts = [text.ljust(SHINGLE) for text in texts]
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    buffer = np.frombuffer(b"".join(texts), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+
+    # Every SHINGLE-byte window of the concatenation as one integer, then
+    # only the windows that lie within a single text
+    windows = np.lib.stride_tricks.sliding_window_view(buffer, SHINGLE).astype(np.uint64)
+    values = np.bitwise_or.reduce(windows << _SHINGLE_SHIFTS, axis=1)
+    counts = lengths - SHINGLE + 1
+    offsets = np.cumsum(counts) - counts
+    within = np.arange(counts.sum()) - np.repeat(offsets, counts)
+    shingles = values[np.repeat(starts, counts) + within]
+
+    # Multiply-shift hashing; uint64 arithmetic wraps, as intended
+    hashes = np.multiply.outer(shingles, _A)
+    hashes += _B
+    hashes >>= np.uint64(32)
+    return np.minimum.reduceat(hashes, offsets, axis=0).astype(np.uint32)
+
+
+def band_buckets(sigs: np.ndarray) -> np.ndarray:
+    """(questions, BANDS) bucket keys as int64, for storage in a BigInteger column."""
+    bands = sigs.reshape(len(sigs), BANDS, ROWS).astype(np.uint64)
+    return (bands * _BAND_MULT).sum(axis=2, dtype=np.uint64).view(np.int64)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a == b).mean(axis=-1)
+
+
+def _batches(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def refresh_index(db: Session, rebuild: bool = False, log: Optional[Callable[[str], None]] = None) -> int:
+    """Bring the persisted signatures up to date with the questions table.
+
+    Does nothing if the content version hasn't moved since the last refresh.
+    Returns the number of questions (re)signed.
+    """
+    version = current_version()
+    checkpoint = db.get(JobCheckpoint, CHECKPOINT)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=CHECKPOINT, position=0)
+        db.add(checkpoint)
+    elif checkpoint.position == version and not rebuild:
+        return 0
+
+    stored = {} if rebuild else {
+        (row.lesson_id, row.question_id): row.digest
+        for row in db.query(QuestionSignature.lesson_id, QuestionSignature.question_id, QuestionSignature.digest)
+    }
+    if rebuild:
+        db.execute(delete(QuestionSignature.__table__))
+        db.execute(delete(QuestionBand.__table__))
+    changed = []
+    for q in db.query(Question.lesson_id, Question.question_id, Question.prompt, Question.answer):
+        key = (q.lesson_id, q.question_id)
+        text = normalized_text(q.prompt, q.answer)
+        text_digest = digest(text)
+        if stored.pop(key, None) != text_digest:
+            changed.append((key, text, text_digest))
+    # Left in stored: questions that no longer exist
+    stale = list(stored) + [key for key, _, _ in changed if not rebuild]
+    for table in (QuestionSignature.__table__, QuestionBand.__table__):
+        for keys in _batches(stale, settings.CONTENT_AUDIT_BATCH_SIZE):
+            db.execute(
+                delete(table).where(table.c.lesson_id == bindparam("l"), table.c.question_id == bindparam("q")),
+                [{"l": lesson_id, "q": question_id} for lesson_id, question_id in keys],
+            )
+
+    for batch in _batches(changed, settings.CONTENT_AUDIT_BATCH_SIZE):
+        sigs = signatures([text for _, text, _ in batch])
+        buckets = band_buckets(sigs)
+        db.execute(insert(QuestionSignature.__table__), [
+            {"lesson_id": key[0], "question_id": key[1], "digest": text_digest, "signature": sig.astype("<u4").tobytes()}
+            for (key, _, text_digest), sig in zip(batch, sigs)
+        ])
+        db.execute(insert(QuestionBand.__table__), [
+            {"bucket": int(bucket), "band": band, "lesson_id": key[0], "question_id": key[1]}
+            for (key, _, _), row in zip(batch, buckets)
+            for band, bucket in enumerate(row)
+        ])
+        if log:
+            log(f"Signed {len(batch)} questions")
+    checkpoint.position = version
+    db.commit()
+    return len(changed)
+
+
+def _load_signatures(db: Session, keys: Optional[Iterable[Key]] = None) -> Tuple[List[Key], np.ndarray]:
+    """Persisted signatures, of all questions or of the given ones."""
+    query = db.query(QuestionSignature.lesson_id, QuestionSignature.question_id, QuestionSignature.signature)
+    if keys is None:
+        rows = query.all()
+    else:
+        keys = set(keys)
+        lesson_ids = sorted({lesson_id for lesson_id, _ in keys})
+        rows = [
+            row
+            for batch in _batches(lesson_ids, settings.CONTENT_AUDIT_BATCH_SIZE)
+            for row in query.filter(QuestionSignature.lesson_id.in_(batch))
+            if (row.lesson_id, row.question_id) in keys
+        ]
+    sigs = np.frombuffer(b"".join(row.signature for row in rows), dtype="<u4").reshape(len(rows), NUM_PERM)
+    return [(row.lesson_id, row.question_id) for row in rows], sigs
+
+
+def _describe(db: Session, keys: Iterable[Key]) -> dict:
+    """key -> question details for reports."""
+    keys = set(keys)
+    lesson_ids = {lesson_id for lesson_id, _ in keys}
+    details = {}
+    for q in db.query(
+        Question.lesson_id, Question.question_id, Question.prompt, Question.answer, Lesson.level_id, Lesson.title
+    ).join(Lesson, Lesson.id == Question.lesson_id).filter(Question.lesson_id.in_(lesson_ids)):
+        key = (q.lesson_id, q.question_id)
+        if key in keys:
+            details[key] = {
+                "level_id": q.level_id,
+                "lesson_id": q.lesson_id,
+                "lesson_title": q.title,
+                "question_id": q.question_id,
+                "question": q.prompt,
+                "answer": q.answer,
+            }
+    return details
+
+
+def find_clusters(db: Session, threshold: Optional[float] = None) -> List[dict]:
+    """Groups of near-identical questions across the catalog, largest first.
+
+    Groups are transitive, so each question's reported similarity (to the
+    group's first question) may be below the threshold.
+    """
+    threshold = settings.CONTENT_AUDIT_THRESHOLD if threshold is None else threshold
+    refresh_index(db)
+    keys, sigs = _load_signatures(db)
+    buckets = band_buckets(sigs)
+
+    parent = list(range(len(keys)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(BANDS):
+        order = np.argsort(buckets[:, band], kind="stable")
+        column = buckets[order, band]
+        starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+        lengths = np.diff(np.r_[starts, len(column)])
+        for start, length in zip(starts[lengths > 1], lengths[lengths > 1]):
+            members = order[start:start + length]
+            if length <= MAX_PAIRWISE:
+                sims = similarity(sigs[members][:, None, :], sigs[members][None, :, :])
+                pairs = zip(*np.nonzero(np.triu(sims >= threshold, 1)))
+            else:
+                sims = similarity(sigs[members], sigs[members[0]])
+                pairs = ((0, j) for j in np.flatnonzero(sims >= threshold) if j)
+            for i, j in pairs:
+                a, b = find(int(members[i])), find(int(members[j]))
+                if a != b:
+                    parent[b] = a
+
+    groups = {}
+    for i in range(len(keys)):
+        groups.setdefault(find(i), []).append(i)
+    groups = sorted((members for members in groups.values() if len(members) > 1), key=len, reverse=True)
+    details = _describe(db, (keys[i] for members in groups for i in members))
+    clusters = []
+    for members in groups:
+        members.sort()
+        sims = similarity(sigs[members], sigs[members[0]])
+        clusters.append({
+            "size": len(members),
+            "questions": [
+                {**details.get(keys[i], {"lesson_id": keys[i][0], "question_id": keys[i][1]}), "similarity": round(float(sim), 3)}
+                for i, sim in zip(members, sims)
+            ],
+        })
+    return clusters
+
+
+def check_questions(
+    db: Session, questions: Sequence[dict], exclude_lesson: Optional[int] = None, threshold: Optional[float] = None
+) -> List[dict]:
+    """Catalog questions similar to each of ``questions`` (dicts with "question" and "answer")."""
+    threshold = settings.CONTENT_AUDIT_THRESHOLD if threshold is None else threshold
+    if not questions:
+        return []
+    refresh_index(db)
+    sigs = signatures([normalized_text(q.get("question", ""), q.get("answer", "")) for q in questions])
+    buckets = band_buckets(sigs)
+
+    candidates = set()
+    for batch in _batches(sorted({int(bucket) for bucket in buckets.ravel()}), settings.CONTENT_AUDIT_BATCH_SIZE):
+        # A bucket key from another band matching is vanishingly unlikely,
+        # and would only add a candidate that fails the similarity check
+        for row in db.query(QuestionBand.lesson_id, QuestionBand.question_id).filter(QuestionBand.bucket.in_(batch)):
+            if row.lesson_id != exclude_lesson:
+                candidates.add((row.lesson_id, row.question_id))
+    keys, candidate_sigs = _load_signatures(db, candidates)
+    details = _describe(db, keys)
+
+    report = []
+    for position, (question, sig) in enumerate(zip(questions, sigs)):
+        sims = similarity(candidate_sigs, sig) if keys else np.zeros(0)
+        matches = sorted(
+            ({**details.get(keys[i], {}), "similarity": round(float(sims[i]), 3)} for i in np.flatnonzero(sims >= threshold)),
+            key=lambda match: -match["similarity"],
+        )
+        report.append({"position": position, "question": question.get("question", ""), "matches": matches})
+    return report
+
+
+def check_lesson(db: Session, lesson_id: int, threshold: Optional[float] = None) -> List[dict]:
+    """Check an existing lesson's questions against the rest of the catalog."""
+    questions = [
+        {"question": q.prompt, "answer": q.answer}
+        for q in db.query(Question.prompt, Question.answer).filter(Question.lesson_id == lesson_id).order_by(Question.position)
+    ]
+    return check_questions(db, questions, exclude_lesson=lesson_id, threshold=threshold)
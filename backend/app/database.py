@@ -1,21 +1,137 @@
 """
 Database configuration and session management.
 """
-from sqlalchemy import create_engine
+import itertools
+import threading
+import time
+from typing import Optional
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
 
-connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(settings.DATABASE_URL, connect_args=connect_args, echo=True)
+
+def _connect_args(url: str) -> dict:
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+
+engine = create_engine(settings.DATABASE_URL, connect_args=_connect_args(settings.DATABASE_URL), echo=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read replicas, used round-robin by get_read_db
+replica_engines = [
+    create_engine(url, connect_args=_connect_args(url), echo=True)
+    for url in settings.DATABASE_REPLICA_URLS
+]
+ReplicaSessions = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    for replica_engine in replica_engines
+]
+_replica_cycle = itertools.cycle(ReplicaSessions)
+_replica_lock = threading.Lock()
+
+# Token subjects that wrote recently -> monotonic time their stickiness ends
+_recent_writers = {}
+_recent_writers_lock = threading.Lock()
+
 Base = declarative_base()
 
-# Dependency to get DB session
-def get_db():
+
+def dialect_insert(db, table):
+    """INSERT into ``table`` for the database the session binds it to, with ON CONFLICT support."""
+    dialect = db.get_bind(clause=table).dialect.name
+    return (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+
+
+def request_subject(request: Optional[Request]) -> Optional[str]:
+    """Return the JWT subject (email) of the request's bearer token, if any."""
+    if request is None:
+        return None
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+def _mark_recent_writer(subject: Optional[str]):
+    if subject is None or not ReplicaSessions:
+        return
+    now = time.monotonic()
+    with _recent_writers_lock:
+        _recent_writers[subject] = now + settings.REPLICA_STICKINESS_SECONDS
+        if len(_recent_writers) > 10000:
+            for key in [k for k, until in _recent_writers.items() if until <= now]:
+                del _recent_writers[key]
+
+
+def _is_recent_writer(subject: Optional[str]) -> bool:
+    if subject is None:
+        return False
+    with _recent_writers_lock:
+        until = _recent_writers.get(subject)
+    return until is not None and until > time.monotonic()
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _flag_orm_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _flag_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _stick_writer_to_primary(session):
+    # Read-your-writes: the writer's reads go to the primary for a short window
+    if session.info.pop("wrote", False):
+        _mark_recent_writer(request_subject(session.info.get("request")))
+
+
+def _refuse_replica_write(session, flush_context, instances):
+    raise RuntimeError("Read-only session: writes must go through get_db")
+
+
+for _replica_session in ReplicaSessions:
+    event.listen(_replica_session, "before_flush", _refuse_replica_write)
+
+
+def _open_session(request: Optional[Request]):
     db = SessionLocal()
+    db.info["request"] = request
+    if settings.SHARD_DATABASE_URLS:
+        from .sharding import route_session_for_subject
+        route_session_for_subject(db, request_subject(request))
+    return db
+
+
+# Dependency to get DB session
+def get_db(request: Request):
+    db = _open_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Dependency to get a read-only DB session (replica when available)
+def get_read_db(request: Request):
+    if settings.SHARD_DATABASE_URLS or not ReplicaSessions or _is_recent_writer(request_subject(request)):
+        db = _open_session(request)
+    else:
+        with _replica_lock:
+            db = next(_replica_cycle)()
     try:
         yield db
     finally:
@@ -0,0 +1,238 @@
+"""
+Bulk enrollment of student rosters.
+
+A roster is CSV with email, username and optional password columns, or
+NDJSON objects with the same keys. It is processed in chunks of
+ENROLL_CHUNK_SIZE rows. Each chunk is validated, checked for taken emails
+and usernames with one set-based query (against the shard directory when
+sharded), hashed with bcrypt in a process pool, and inserted with one
+multi-row statement. Every row gets a result record, yielded as soon as its
+chunk is done.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from email_validator import EmailNotValidError, validate_email
+from sqlalchemy import bindparam, delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import sharding
+from .config import settings
+from .database import SessionLocal
+from .models.user import User
+from .models.user_directory import UserDirectory
+from .passwords import get_password_hash
+
+FORMATS = ("csv", "ndjson")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _hash_workers() -> int:
+    return settings.ENROLL_HASH_WORKERS or os.cpu_count() or 1
+
+
+def _hash_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, so workers don't inherit the server's threads and connections
+            _pool = ProcessPoolExecutor(_hash_workers(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    chunksize = max(1, len(passwords) // (_hash_workers() * 4))
+    return list(_hash_pool().map(get_password_hash, passwords, chunksize=chunksize))
+
+
+def read_roster(lines: Iterable[str], fmt: str) -> Iterator[dict]:
+    """Raw roster rows as dicts; rows that cannot be parsed carry an "_error" key."""
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            yield {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {"_error": "Invalid JSON object"}
+
+
+class _Chunk:
+    def __init__(self):
+        self.results = []  # one per row, in roster order
+        self.pending = []  # (result, password) of rows still to be inserted
+
+
+def _validate(rows, first_row: int, seen_emails: set, seen_usernames: set) -> _Chunk:
+    chunk = _Chunk()
+    for number, raw in enumerate(rows, first_row):
+        email = str(raw.get("email") or "").strip()
+        username = str(raw.get("username") or "").strip()
+        result = {"row": number, "email": email, "username": username}
+        chunk.results.append(result)
+        if "_error" in raw:
+            result.update(status="invalid", detail=raw["_error"])
+            continue
+        if not email or not username:
+            result.update(status="invalid", detail="email and username are required")
+            continue
+        try:
+            email = result["email"] = validate_email(email, check_deliverability=False).normalized
+        except EmailNotValidError as exc:
+            result.update(status="invalid", detail=str(exc))
+            continue
+        if email in seen_emails or username in seen_usernames:
+            result.update(status="duplicate", detail="Email or username repeated in the roster")
+            continue
+        seen_emails.add(email)
+        seen_usernames.add(username)
+
+        password = str(raw.get("password") or "")
+        if not password:
+            password = result["password"] = secrets.token_urlsafe(9)
+        chunk.pending.append((result, password))
+    return chunk
+
+
+def _drop_taken(db: Session, chunk: _Chunk):
+    """Mark rows whose email or username is already registered, in one query."""
+    if not chunk.pending:
+        return
+    model = UserDirectory if sharding.is_enabled() else User
+    emails = [result["email"] for result, _ in chunk.pending]
+    usernames = [result["username"] for result, _ in chunk.pending]
+    taken_emails, taken_usernames = set(), set()
+    for email, username in db.query(model.email, model.username).filter(
+        or_(model.email.in_(emails), model.username.in_(usernames))
+    ):
+        taken_emails.add(email)
+        taken_usernames.add(username)
+
+    pending = []
+    for result, password in chunk.pending:
+        if result["email"] in taken_emails or result["username"] in taken_usernames:
+            result.update(status="conflict", detail="Email or username already registered")
+            result.pop("password", None)
+        else:
+            pending.append((result, password))
+    chunk.pending = pending
+
+
+def _insert_users(db: Session, rows: List[dict]) -> List[int]:
+    # RETURNING rows are matched back by email: asking for them in parameter
+    # order makes SQLAlchemy fall back to one INSERT per row on some backends
+    users = User.__table__
+    if not sharding.is_enabled():
+        ids = dict(db.execute(insert(users).returning(users.c.email, users.c.id), rows).all())
+        db.commit()
+        return [ids[row["email"]] for row in rows]
+
+    # Reserve global ids in the directory and commit them first, so the emails
+    # and usernames are claimed before any shard has a row for them
+    directory = UserDirectory.__table__
+    ids = dict(db.execute(
+        insert(directory).returning(directory.c.email, directory.c.id),
+        [{"email": row["email"], "username": row["username"], "shard": 0} for row in rows],
+    ).all())
+    ids = [ids[row["email"]] for row in rows]
+    by_shard = {}
+    for user_id, row in zip(ids, rows):
+        by_shard.setdefault(sharding.router.shard_for(user_id), []).append({**row, "id": user_id})
+    db.execute(
+        update(directory).where(directory.c.id == bindparam("user_id")).values(shard=bindparam("user_shard")),
+        [{"user_id": row["id"], "user_shard": shard} for shard, group in by_shard.items() for row in group],
+    )
+    db.commit()
+
+    written = []
+    try:
+        for shard, group in by_shard.items():
+            with sharding.shard_session(shard) as shard_db:
+                shard_db.execute(insert(users), group)
+                shard_db.commit()
+            written.append(shard)
+    except Exception:
+        # Remove what earlier shards committed and release the reserved ids,
+        # so a retry starts from a state with no half-enrolled users
+        for shard in written:
+            with sharding.shard_session(shard) as shard_db:
+                shard_db.execute(delete(users).where(users.c.id.in_([row["id"] for row in by_shard[shard]])))
+                shard_db.commit()
+        db.execute(delete(directory).where(directory.c.id.in_(ids)))
+        db.commit()
+        for row in rows:
+            sharding.forget_email(row["email"])
+        raise
+    return ids
+
+
+def _insert(db: Session, chunk: _Chunk):
+    if not chunk.pending:
+        return
+    hashes = hash_passwords([password for _, password in chunk.pending])
+    chunk.pending = [(result, hashed) for (result, _), hashed in zip(chunk.pending, hashes)]
+    for attempt in range(2):
+        rows = [
+            {
+                "email": result["email"],
+                "username": result["username"],
+                "hashed_password": hashed,
+                "level": 1,
+                "experience": 0,
+                "hearts": 5,
+            }
+            for result, hashed in chunk.pending
+        ]
+        try:
+            ids = _insert_users(db, rows)
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+            # Someone registered one of these since the check; recheck and retry once
+            _drop_taken(db, chunk)
+            if not chunk.pending:
+                return
+            continue
+        for (result, _), user_id in zip(chunk.pending, ids):
+            result.update(status="created", id=user_id)
+        return
+
+
+def enroll(rows: Iterable[dict], chunk_size: Optional[int] = None) -> Iterator[dict]:
+    """Enroll roster rows, yielding one result per row and then {"summary": counts}."""
+    chunk_size = chunk_size or settings.ENROLL_CHUNK_SIZE
+    rows = iter(rows)
+    seen_emails, seen_usernames = set(), set()
+    summary = {"created": 0, "conflict": 0, "duplicate": 0, "invalid": 0}
+    first_row = 1
+    db = SessionLocal()
+    try:
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+            chunk = _validate(batch, first_row, seen_emails, seen_usernames)
+            first_row += len(batch)
+            _drop_taken(db, chunk)
+            _insert(db, chunk)
+            for result in chunk.results:
+                summary[result["status"]] += 1
+                yield result
+    finally:
+        db.close()
+    yield {"summary": summary}
@@ -0,0 +1,144 @@
+"""
+In-process pub/sub for server-sent events.
+
+Each connection is a Subscriber holding at most one pending event per event
+type. Publishing overwrites the pending value instead of queueing, so a slow
+or stalled client costs a bounded amount of memory and gets the latest state
+when it catches up. Publishers may run in worker threads; fan-out always
+happens on the event loop.
+
+Subscribers only receive events published by the same worker process.
+"""
+import asyncio
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class Subscriber:
+    __slots__ = ("topics", "pending", "ready")
+
+    def __init__(self, topics: Tuple[str, ...]):
+        self.topics = topics
+        self.pending: Dict[str, dict] = {}
+        self.ready = asyncio.Event()
+
+    def offer(self, event: str, data: dict):
+        self.pending[event] = data
+        self.ready.set()
+
+    def drain(self) -> List[Tuple[str, dict]]:
+        events = list(self.pending.items())
+        self.pending.clear()
+        self.ready.clear()
+        return events
+
+
+class EventHub:
+    def __init__(self):
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, topics: Iterable[str]) -> Subscriber:
+        """Register a subscriber; must be called on the event loop."""
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(tuple(topics))
+        for topic in subscriber.topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        for topic in subscriber.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._topics
+
+    def connection_count(self) -> int:
+        return len({s for subscribers in list(self._topics.values()) for s in subscribers})
+
+    def publish(self, topic: str, event: str, data: dict):
+        """Send an event to a topic's subscribers; safe to call from any thread."""
+        if self._loop is None or topic not in self._topics:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._fanout(topic, event, data)
+        else:
+            self._loop.call_soon_threadsafe(self._fanout, topic, event, data)
+
+    def _fanout(self, topic: str, event: str, data: dict):
+        for subscriber in self._topics.get(topic, ()):
+            subscriber.offer(event, data)
+
+
+hub = EventHub()
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def publish_user_stats(user_id: int, stats: dict):
+    hub.publish(user_topic(user_id), "stats", stats)
+
+
+# Set when experience changes; the leaderboard task rechecks the top list
+_leaderboard_dirty = threading.Event()
+
+
+def leaderboard_changed():
+    _leaderboard_dirty.set()
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def event_stream(topics: Iterable[str], heartbeat: float, initial: Iterable[Tuple[str, dict]] = ()):
+    """Subscribe to ``topics`` and yield SSE frames until the client disconnects.
+
+    The subscription is made on first iteration, so a response that never
+    starts streaming leaves nothing registered in the hub.
+    """
+    subscriber = hub.subscribe(topics)
+    try:
+        yield "retry: 5000\n\n"
+        for event, data in initial:
+            yield format_event(event, data)
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.ready.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            for event, data in subscriber.drain():
+                yield format_event(event, data)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+async def leaderboard_publisher(interval: float, load_entries):
+    """Push the top list to "leaderboard" subscribers whenever it changes.
+
+    ``load_entries`` is a blocking callable returning the current entries; it
+    runs in a worker thread at most once per interval, and only while someone
+    is listening and experience has changed.
+    """
+    last = None
+    while True:
+        await asyncio.sleep(interval)
+        if not hub.has_subscribers("leaderboard") or not _leaderboard_dirty.is_set():
+            continue
+        _leaderboard_dirty.clear()
+        entries = await asyncio.to_thread(load_entries)
+        if entries != last:
+            last = entries
+            hub.publish("leaderboard", "leaderboard", entries)
@@ -0,0 +1,125 @@
+"""
+Streaming export of learner history as NDJSON or CSV.
+
+Rows are read with server-side cursors (yield_per) on a dedicated connection
+and encoded in small chunks, so memory stays flat however large the table is.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import select
+
+from . import sharding
+from .database import SessionLocal, engine, replica_engines
+from .models.lesson import Lesson
+from .models.user import User
+from .models.user_progress import UserProgress
+from .models.wrong_question import ArchivedWrongQuestion, WrongQuestion
+
+# table name -> (model, timestamp column used for the date range, exported columns)
+# Columns are listed explicitly so new internal columns (password hashes,
+# sync bookkeeping, completion bitmaps) don't leak into exports
+_HISTORY_COLUMNS = (
+    "id", "user_id", "lesson_id", "question_id", "question_text", "correct_answer", "user_answer",
+    "mastered", "created_at", "last_reviewed",
+)
+EXPORT_TABLES = {
+    "users": (User, User.created_at, (
+        "id", "email", "username", "avatar_url", "level", "experience", "hearts", "max_hearts", "coins",
+        "boost_expires_at", "streak_count", "last_lesson_at", "created_at", "last_login", "is_active", "is_superuser",
+    )),
+    "user_progress": (UserProgress, UserProgress.last_attempt, (
+        "id", "user_id", "lesson_id", "attempts", "completed", "best_score", "last_attempt",
+    )),
+    "wrong_questions": (WrongQuestion, WrongQuestion.created_at, _HISTORY_COLUMNS),
+    "wrong_questions_archive": (ArchivedWrongQuestion, ArchivedWrongQuestion.created_at, _HISTORY_COLUMNS + ("archived_at",)),
+}
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+BATCH_SIZE = 1000
+
+
+def export_columns(table: str) -> List[str]:
+    return list(EXPORT_TABLES[table][2])
+
+
+def _source_engines() -> list:
+    if sharding.is_enabled():
+        return sharding.shard_engines
+    return [replica_engines[0] if replica_engines else engine]
+
+
+def _level_lesson_ids(level_id: int) -> List[int]:
+    db = SessionLocal()
+    try:
+        return [row[0] for row in db.query(Lesson.id).filter(Lesson.level_id == level_id)]
+    finally:
+        db.close()
+
+
+def iter_rows(
+    table: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    level_id: Optional[int] = None,
+) -> Iterator[tuple]:
+    """Yield rows of ``table`` in export_columns order.
+
+    ``level_id`` filters progress and mistakes by the lesson's level, and
+    users by their current level.
+    """
+    model, timestamp, _ = EXPORT_TABLES[table]
+    columns = [model.__table__.c[name] for name in export_columns(table)]
+    query = select(*columns).order_by(model.__table__.c.id)
+    if start is not None:
+        query = query.where(timestamp >= start)
+    if end is not None:
+        query = query.where(timestamp < end)
+    if level_id is not None:
+        if model is User:
+            query = query.where(User.level == level_id)
+        else:
+            # Lessons live in the shared database, so resolve ids up front
+            query = query.where(model.lesson_id.in_(_level_lesson_ids(level_id)))
+
+    for source in _source_engines():
+        with source.connect() as conn:
+            result = conn.execution_options(yield_per=BATCH_SIZE).execute(query)
+            for partition in result.partitions():
+                yield from partition
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_chunks(table: str, rows: Iterator[tuple]) -> Iterator[str]:
+    names = export_columns(table)
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({name: _json_value(v) for name, v in zip(names, row)}))
+        if len(lines) >= BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def csv_chunks(table: str, rows: Iterator[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_columns(table))
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_json_value(v) for v in row])
+        if i % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_chunks(table: str, fmt: str, **filters) -> Iterator[str]:
+    rows = iter_rows(table, **filters)
+    return ndjson_chunks(table, rows) if fmt == "ndjson" else csv_chunks(table, rows)
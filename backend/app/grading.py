@@ -0,0 +1,97 @@
+"""
+Server-side grading against an in-memory answer key.
+
+The key holds a short digest of each question's normalized answer, loaded
+once per lesson and content version, so grading a submission is a dict
+lookup and a hash per answer with no database access.
+"""
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .catalog import versioned
+from .database import SessionLocal
+from .models.lesson import Lesson
+from .models.question import Question
+
+
+def normalize_answer(text: str) -> str:
+    """Case-, width- and whitespace-insensitive form of an answer."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def answer_digest(text: str) -> bytes:
+    return hashlib.blake2b(normalize_answer(text).encode(), digest_size=16).digest()
+
+
+class GradeResult(NamedTuple):
+    score: int  # percentage
+    correct: int
+    total: int
+    wrong: Dict[int, str]  # question_id -> the user's answer ("" if unanswered)
+
+
+class AnswerKeyIndex:
+    """Answer digests per lesson, loaded lazily for one content version."""
+
+    def __init__(self):
+        self._lessons: Dict[int, Optional[Dict[int, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def for_lesson(self, lesson_id: int) -> Optional[Dict[int, bytes]]:
+        """question_id -> answer digest, or None if the lesson does not exist."""
+        try:
+            return self._lessons[lesson_id]
+        except KeyError:
+            pass
+        db = SessionLocal()
+        try:
+            key = self._load(db, lesson_id)
+        finally:
+            db.close()
+        with self._lock:
+            self._lessons[lesson_id] = key
+        return key
+
+    def load_all(self, db: Session) -> "AnswerKeyIndex":
+        """Load every lesson's key in two queries, e.g. before forking workers."""
+        keys = {lesson_id: {} for (lesson_id,) in db.query(Lesson.id)}
+        for lesson_id, question_id, answer in db.query(Question.lesson_id, Question.question_id, Question.answer):
+            key = keys.get(lesson_id)
+            if key is not None:
+                key[question_id] = answer_digest(answer)
+        with self._lock:
+            self._lessons.update(keys)
+        return self
+
+    @staticmethod
+    def _load(db: Session, lesson_id: int) -> Optional[Dict[int, bytes]]:
+        if db.query(Lesson.id).filter(Lesson.id == lesson_id).first() is None:
+            return None
+        rows = db.query(Question.question_id, Question.answer).filter(Question.lesson_id == lesson_id)
+        return {question_id: answer_digest(answer) for question_id, answer in rows}
+
+
+def answer_keys() -> AnswerKeyIndex:
+    return versioned("answer_keys", lambda db: AnswerKeyIndex())
+
+
+def grade(key: Dict[int, bytes], answers: Iterable[Tuple[int, str]]) -> GradeResult:
+    """Grade (question_id, answer) pairs against a lesson's key.
+
+    Every question in the key counts towards the score; unanswered ones are
+    wrong. Answers to unknown question ids are ignored.
+    """
+    given = {question_id: answer for question_id, answer in answers if question_id in key}
+    wrong = {}
+    for question_id, digest in key.items():
+        answer = given.get(question_id)
+        if answer is None or answer_digest(answer) != digest:
+            wrong[question_id] = answer or ""
+    total = len(key)
+    correct = total - len(wrong)
+    score = round(correct * 100 / total) if total else 0
+    return GradeResult(score=score, correct=correct, total=total, wrong=wrong)
@@ -0,0 +1,172 @@
+"""
+Idempotency-Key support for retried POSTs.
+
+The first request with a key does its work and stores its response in the
+same transaction, so a retry replays that response without touching any
+other table. Stored responses are cached in a per-process LRU with TTL.
+The idempotency_keys table keeps them correct across workers: if two
+requests with the same key race, the loser's commit hits the primary key,
+rolls back, and it returns the winner's response. Expired rows are
+purged by the task sweeper.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models.idempotency_key import IdempotencyKey
+
+
+class ResponseCache:
+    """Bounded LRU of (user_id, key) -> (endpoint, fingerprint, response, expires_at)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[3] <= time.time():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, entry):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_cache = ResponseCache(settings.IDEMPOTENCY_CACHE_SIZE)
+
+# (user_id, key) -> [lock, holders]; serializes same-key requests within a process
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _key_lock(cache_key) -> Iterator[None]:
+    with _key_locks_guard:
+        entry = _key_locks.setdefault(cache_key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _key_locks[cache_key]
+
+
+def fingerprint(body) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(body), sort_keys=True).encode()).hexdigest()
+
+
+class IdempotentRequest:
+    """One request's view of its Idempotency-Key. ``replayed`` is set for retries."""
+
+    def __init__(self, db: Session, user_id: int, key: Optional[str], endpoint: str, body):
+        self.db = db
+        self.user_id = user_id
+        self.key = key
+        self.endpoint = endpoint
+        self.fingerprint = fingerprint(body) if key else None
+        self.replayed = self._lookup() if key else None
+
+    def _check(self, endpoint, stored_fingerprint, response):
+        if endpoint != self.endpoint or stored_fingerprint != self.fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request",
+            )
+        return response
+
+    def _lookup(self):
+        cache_key = (self.user_id, self.key)
+        cached = _cache.get(cache_key)
+        if cached is not None:
+            return self._check(*cached[:3])
+        stored = self.db.get(IdempotencyKey, cache_key)
+        if stored is None:
+            return None
+        if stored.expires_at <= time.time():
+            # Free the key for reuse within this request's transaction
+            self.db.delete(stored)
+            return None
+        response = json.loads(stored.response)
+        _cache.put(cache_key, (stored.endpoint, stored.fingerprint, response, stored.expires_at))
+        return self._check(stored.endpoint, stored.fingerprint, response)
+
+    def commit(self, response):
+        """Store the response with the request's work, commit, and return it."""
+        if not self.key:
+            self.db.commit()
+            return response
+        response = jsonable_encoder(response)
+        expires_at = int(time.time()) + settings.IDEMPOTENCY_TTL_SECONDS
+        self.db.add(IdempotencyKey(
+            user_id=self.user_id,
+            key=self.key,
+            endpoint=self.endpoint,
+            fingerprint=self.fingerprint,
+            response=json.dumps(response),
+            expires_at=expires_at,
+        ))
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # Another worker committed this key first; its response wins
+            self.db.rollback()
+            winner = self._lookup()
+            if winner is None:
+                raise
+            return winner
+        _cache.put((self.user_id, self.key), (self.endpoint, self.fingerprint, response, expires_at))
+        return response
+
+
+def purge_expired(db: Session) -> int:
+    """Delete stored responses past their TTL; returns how many. The caller commits."""
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at < time.time()
+    ).delete(synchronize_session=False)
+
+
+@contextmanager
+def idempotent(db: Session, user_id: int, key: Optional[str], endpoint: str, body) -> Iterator[IdempotentRequest]:
+    """Guard a write endpoint with an optional Idempotency-Key.
+
+    Usage::
+
+        with idempotent(db, user.id, idempotency_key, "shop.buy", request) as req:
+            if req.replayed is not None:
+                return req.replayed
+            ...  # do the work without committing
+            return req.commit(response)
+    """
+    if not key:
+        yield IdempotentRequest(db, user_id, None, endpoint, body)
+        return
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+    # Don't hold a pooled connection while queued behind a request with the same key
+    db.rollback()
+    with _key_lock((user_id, key)):
+        yield IdempotentRequest(db, user_id, key, endpoint, body)
@@ -0,0 +1,101 @@
+"""
+Dense lesson numbering and per-user completion bitmaps.
+
+Lessons are numbered 0..n-1 in curriculum order (Level.order, Lesson.order).
+A user's completed lessons are kept on the user row as a little-endian
+bitmap over that numbering, tagged with the layout it was encoded against.
+Adding, removing or reordering lessons changes the layout; a stale bitmap is
+rebuilt from user_progress the next time it is used.
+"""
+import hashlib
+from bisect import bisect_right
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .catalog import versioned
+from .models.lesson import Lesson
+from .models.level import Level
+from .models.user import User
+from .models.user_progress import UserProgress
+
+
+class LessonSequence:
+    """The catalog's lessons in order, with a bitmask of lessons unlocked at each XP threshold."""
+
+    def __init__(self, rows):
+        # rows: (lesson id, level id, title, level's required_experience) in curriculum order
+        self.lessons = [(lesson_id, level_id, title) for lesson_id, level_id, title, _ in rows]
+        self.positions = {lesson_id: i for i, (lesson_id, _, _) in enumerate(self.lessons)}
+        self.layout = hashlib.blake2b(
+            ",".join(str(lesson_id) for lesson_id, _, _ in self.lessons).encode(), digest_size=8
+        ).hexdigest()
+
+        masks = {}
+        for i, (_, _, _, required) in enumerate(rows):
+            masks[required or 0] = masks.get(required or 0, 0) | (1 << i)
+        self._thresholds = sorted(masks)
+        self._unlocked = []
+        unlocked = 0
+        for threshold in self._thresholds:
+            unlocked |= masks[threshold]
+            self._unlocked.append(unlocked)
+
+    def __len__(self):
+        return len(self.lessons)
+
+    def unlocked_mask(self, experience: int) -> int:
+        i = bisect_right(self._thresholds, experience)
+        return self._unlocked[i - 1] if i else 0
+
+    def next_position(self, completed: int, experience: int) -> Optional[int]:
+        """Position of the first incomplete lesson in an unlocked level."""
+        todo = self.unlocked_mask(experience) & ~completed
+        if not todo:
+            return None
+        return (todo & -todo).bit_length() - 1
+
+
+def _build_sequence(db: Session) -> LessonSequence:
+    return LessonSequence(
+        db.query(Lesson.id, Lesson.level_id, Lesson.title, Level.required_experience)
+        .join(Level, Lesson.level_id == Level.id)
+        .order_by(Level.order, Lesson.order, Lesson.id)
+        .all()
+    )
+
+
+def lesson_sequence() -> LessonSequence:
+    return versioned("lesson_sequence", _build_sequence)
+
+
+def _store(user: User, bits: int, sequence: LessonSequence):
+    user.completed_lessons = bits.to_bytes((len(sequence) + 7) // 8, "little")
+    user.completed_layout = sequence.layout
+
+
+def completed_bits(db: Session, user: User, sequence: Optional[LessonSequence] = None) -> int:
+    """The user's completion bitmap, rebuilt (and left for the caller to commit) if stale."""
+    sequence = sequence or lesson_sequence()
+    if user.completed_layout == sequence.layout and user.completed_lessons is not None:
+        return int.from_bytes(user.completed_lessons, "little")
+    bits = 0
+    for (lesson_id,) in db.query(UserProgress.lesson_id).filter(
+        UserProgress.user_id == user.id, UserProgress.completed == True
+    ):
+        position = sequence.positions.get(lesson_id)
+        if position is not None:
+            bits |= 1 << position
+    _store(user, bits, sequence)
+    return bits
+
+
+def mark_completed(db: Session, user: User, lesson_id: int):
+    """Set the lesson's bit; the caller commits."""
+    sequence = lesson_sequence()
+    # Re-read under a row lock so concurrent completions don't overwrite each other
+    db.refresh(user, ["completed_lessons", "completed_layout"], with_for_update=True)
+    bits = completed_bits(db, user, sequence)
+    position = sequence.positions.get(lesson_id)
+    if position is not None:
+        _store(user, bits | (1 << position), sequence)
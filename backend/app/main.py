@@ -1,18 +1,28 @@
 """
 EnglishQuest Backend - FastAPI entry point.
 """
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .compression import CompressionMiddleware
 from .config import settings
-from .database import engine, Base
-from .api import auth, users, lessons, progress, shop, mistakes
+from .database import engine, replica_engines, Base, SessionLocal
+from . import sharding
+from .api import auth, users, lessons, progress, shop, mistakes, admin, analytics, sync, events, activity, search, bundles
+from .events import leaderboard_publisher
+from . import tasks
 
 # Import models so that Base.metadata is aware of them
 from .models import level, lesson, user_progress, wrong_question
 
 # Create database tables (for development, use Alembic in production)
-Base.metadata.create_all(bind=engine)
+if sharding.is_enabled():
+    sharding.create_all()
+else:
+    for bind in (engine, *replica_engines):
+        Base.metadata.create_all(bind=bind)
 
 app = FastAPI(
     title="EnglishQuest API",
@@ -28,6 +38,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    excluded_types=settings.COMPRESSION_EXCLUDED_TYPES,
+)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
@@ -36,6 +51,29 @@ app.include_router(lessons.router, prefix="/api/lessons", tags=["lessons"])
 app.include_router(progress.router, prefix="/api/progress", tags=["progress"])
 app.include_router(shop.router, prefix="/api/shop", tags=["shop"])
 app.include_router(mistakes.router, prefix="/api/mistakes", tags=["mistakes"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(sync.router, prefix="/api/sync", tags=["sync"])
+app.include_router(events.router, prefix="/api/events", tags=["events"])
+app.include_router(activity.router, prefix="/api/activity", tags=["activity"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
+app.include_router(bundles.router, prefix="/api/bundles", tags=["bundles"])
+
+def _load_leaderboard():
+    db = SessionLocal()
+    try:
+        return users.leaderboard_entries(db)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def start_background_work():
+    asyncio.create_task(leaderboard_publisher(settings.LEADERBOARD_PUSH_SECONDS, _load_leaderboard))
+    tasks.start()
+
+@app.on_event("shutdown")
+def stop_background_work():
+    tasks.stop()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,107 @@
+"""
+Hot/cold split of the mistake notebook.
+
+Mastered mistakes last reviewed more than MISTAKE_ARCHIVE_AGE_DAYS ago move
+from wrong_questions to wrong_questions_archive, so the notebook's table and
+indexes hold only live entries. Rows are deleted with RETURNING and inserted
+into the archive in the same transaction, and the delete re-checks that the
+row is mastered, so every row is in exactly one of the two tables. An id
+already in the archive is skipped rather than failing the batch; ids are
+never reused, so only a replay of the same row can hit one. A tombstone at
+the row's own sync_version tells clients that have not synced since it was
+mastered to drop it.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from . import sharding
+from .config import settings
+from .database import SessionLocal, dialect_insert
+from .models.job_checkpoint import JobCheckpoint
+from .models.sync_tombstone import SyncTombstone
+from .models.wrong_question import ArchivedWrongQuestion, WrongQuestion
+
+CHECKPOINT = "mistake_archive"
+
+
+def archive_mistakes(db: Session, condition) -> int:
+    """Move mastered mistakes matching ``condition`` to the archive; the caller commits."""
+    hot = WrongQuestion.__table__
+    rows = db.execute(
+        delete(hot).where(hot.c.mastered == True, condition).returning(*hot.c)
+    ).mappings().all()
+    if rows:
+        db.execute(
+            dialect_insert(db, ArchivedWrongQuestion.__table__).on_conflict_do_nothing(index_elements=["id"]),
+            [dict(row) for row in rows],
+        )
+        db.execute(insert(SyncTombstone.__table__), [
+            {"user_id": row["user_id"], "kind": "mistake", "row_id": row["id"], "sync_version": row["sync_version"]}
+            for row in rows
+        ])
+    return len(rows)
+
+
+def _archive_partition(
+    db: Session, name: str, cutoff: datetime, batch_size: int, pause: float, max_batches: Optional[int], log,
+) -> int:
+    checkpoint = db.get(JobCheckpoint, name)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=name, position=0)
+        db.add(checkpoint)
+    eligible = (WrongQuestion.mastered == True) & (WrongQuestion.last_reviewed < cutoff)
+
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = [row[0] for row in db.query(WrongQuestion.id).filter(
+            WrongQuestion.id > checkpoint.position, eligible
+        ).order_by(WrongQuestion.id).limit(batch_size)]
+        if not ids:
+            # Pass complete; the next run starts from the beginning
+            checkpoint.position = 0
+            db.commit()
+            break
+        count = archive_mistakes(db, WrongQuestion.__table__.c.id.in_(ids) & eligible)
+        checkpoint.position = ids[-1]
+        # With sharding the checkpoint is in the shared database and commits
+        # separately from the batch. Either order is safe: a checkpoint left
+        # behind rescans rows that are already gone from wrong_questions, and
+        # one that got ahead skips rows only until the next pass starts over.
+        db.commit()
+        moved += count
+        batches += 1
+        log(f"{name}: archived {count} up to id {ids[-1]}")
+        time.sleep(pause)
+    return moved
+
+
+def run_archiver(
+    age_days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    pause: Optional[float] = None,
+    max_batches: Optional[int] = None,
+    log=print,
+) -> int:
+    """Archive old mastered mistakes in batches, resuming where the last run stopped.
+
+    ``max_batches`` bounds the work per database. Returns the number of rows moved.
+    """
+    age_days = settings.MISTAKE_ARCHIVE_AGE_DAYS if age_days is None else age_days
+    batch_size = batch_size or settings.MISTAKE_ARCHIVE_BATCH_SIZE
+    pause = settings.MISTAKE_ARCHIVE_PAUSE_SECONDS if pause is None else pause
+    # last_reviewed is written as local time by mark_as_mastered
+    cutoff = datetime.now() - timedelta(days=age_days)
+
+    moved = 0
+    if sharding.is_enabled():
+        for shard in range(len(sharding.shard_engines)):
+            with sharding.shard_session(shard) as db:
+                moved += _archive_partition(db, f"{CHECKPOINT}:{shard}", cutoff, batch_size, pause, max_batches, log)
+    else:
+        with SessionLocal() as db:
+            moved += _archive_partition(db, CHECKPOINT, cutoff, batch_size, pause, max_batches, log)
+    return moved
@@ -6,4 +6,15 @@ from .user import User
 from .level import Level
 from .lesson import Lesson
 from .user_progress import UserProgress
-from .wrong_question import WrongQuestion
+from .wrong_question import WrongQuestion, ArchivedWrongQuestion
+from .user_directory import UserDirectory
+from .question import Question
+from .content_version import ContentVersion
+from .question_stats import QuestionStat, QuestionOptionStat
+from .idempotency_key import IdempotencyKey
+from .sync_tombstone import SyncTombstone
+from .outbox_task import OutboxTask
+from .task_receipt import TaskReceipt
+from .activity import UserDailyActivity, ActivityRollup
+from .job_checkpoint import JobCheckpoint
+from .question_signature import QuestionSignature, QuestionBand
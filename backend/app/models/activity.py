@@ -0,0 +1,27 @@
+"""
+Activity rollups: per-user daily totals and global totals per day, week and month.
+"""
+from sqlalchemy import Column, Date, Integer, String
+from ..database import Base
+
+class UserDailyActivity(Base):
+    __tablename__ = "user_daily_activity"
+    __shard_key__ = "user_id"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC
+    xp = Column(Integer, nullable=False, default=0)
+    lessons = Column(Integer, nullable=False, default=0)
+    seconds = Column(Integer, nullable=False, default=0)
+    mistakes = Column(Integer, nullable=False, default=0)
+
+class ActivityRollup(Base):
+    __tablename__ = "activity_rollups"
+
+    period = Column(String, primary_key=True)  # day, week or month
+    start = Column(Date, primary_key=True)  # first day of the period
+    active_users = Column(Integer, nullable=False, default=0)
+    xp = Column(Integer, nullable=False, default=0)
+    lessons = Column(Integer, nullable=False, default=0)
+    seconds = Column(Integer, nullable=False, default=0)
+    mistakes = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,84 @@
+"""
+ContentVersion model: a counter bumped whenever levels, lessons or questions change.
+
+Per-process caches built from the catalog compare against it and rebuild when
+it moves. Changes made in this process are seen immediately; changes made by
+other processes are picked up within CATALOG_VERSION_CHECK_SECONDS.
+"""
+import threading
+import time
+from itertools import chain
+
+from sqlalchemy import Column, Integer, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import Base, SessionLocal
+from .level import Level
+from .lesson import Lesson
+from .question import Question
+
+CATALOG_MODELS = (Level, Lesson, Question)
+
+class ContentVersion(Base):
+    __tablename__ = "content_version"
+
+    id = Column(Integer, primary_key=True)  # single row, id 1
+    version = Column(Integer, nullable=False, default=1)
+
+
+_known = {"version": None, "checked_at": 0.0}
+_known_lock = threading.Lock()
+
+
+def current_version() -> int:
+    """Return the catalog content version, re-reading it at most every few seconds."""
+    now = time.monotonic()
+    with _known_lock:
+        if _known["version"] is not None and now - _known["checked_at"] < settings.CATALOG_VERSION_CHECK_SECONDS:
+            return _known["version"]
+    db = SessionLocal()
+    try:
+        version = db.execute(select(ContentVersion.version).where(ContentVersion.id == 1)).scalar() or 0
+    finally:
+        db.close()
+    with _known_lock:
+        _known["version"] = version
+        _known["checked_at"] = now
+    return version
+
+
+def expire_known_version():
+    with _known_lock:
+        _known["version"] = None
+
+
+@event.listens_for(Session, "before_flush")
+def _detect_catalog_change(session, flush_context, instances):
+    if any(isinstance(obj, CATALOG_MODELS) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_content_version(session, flush_context):
+    if not session.info.pop("catalog_changed", False):
+        return
+    conn = session.connection(bind_arguments={"mapper": ContentVersion.__mapper__})
+    bumped = conn.execute(
+        update(ContentVersion.__table__).where(ContentVersion.__table__.c.id == 1)
+        .values(version=ContentVersion.__table__.c.version + 1)
+    )
+    if bumped.rowcount == 0:
+        conn.execute(insert(ContentVersion.__table__).values(id=1, version=1))
+    session.info["catalog_bumped"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _expire_after_commit(session):
+    if session.info.pop("catalog_bumped", False):
+        expire_known_version()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_bump(session):
+    session.info.pop("catalog_bumped", None)
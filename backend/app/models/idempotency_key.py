@@ -0,0 +1,21 @@
+"""
+IdempotencyKey model: the stored response of a request made with an Idempotency-Key header.
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __shard_key__ = "user_id"
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    user_id = Column(Integer, primary_key=True)
+    key = Column(String, primary_key=True)
+    endpoint = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)  # hash of the request body
+    response = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(Integer, nullable=False)  # unix time
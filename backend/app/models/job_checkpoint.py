@@ -0,0 +1,13 @@
+"""
+JobCheckpoint model: where a resumable batch job left off.
+"""
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from ..database import Base
+
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    name = Column(String, primary_key=True)  # job name, plus the shard for per-shard jobs
+    position = Column(Integer, nullable=False, default=0)  # last id processed
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
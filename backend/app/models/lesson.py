@@ -13,7 +13,7 @@ class Lesson(Base):
     title = Column(String, nullable=False)
     description = Column(Text, default="")
     type = Column(String, default="multiple_choice")  # multiple_choice, fill_in, etc.
-    content = Column(Text, default="")  # JSON string storing questions/answers
+    content = Column(Text, default="")  # legacy JSON questions; unpacked into the questions table
     order = Column(Integer, nullable=False)  # within level
 
     level = relationship("Level", backref="lessons")
@@ -0,0 +1,22 @@
+"""
+OutboxTask model: durable record of deferred work, written in the request's transaction.
+"""
+from sqlalchemy import Column, Integer, String, Text, Float, Index
+from ..database import Base
+
+class OutboxTask(Base):
+    __tablename__ = "task_outbox"
+    __shard_key__ = "user_id"
+    __table_args__ = (
+        Index("ix_task_outbox_pending", "processed_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(Float, nullable=False)  # unix time
+    claimed_until = Column(Float, nullable=True)  # lease held by a worker
+    processed_at = Column(Float, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
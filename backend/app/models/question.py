@@ -0,0 +1,22 @@
+"""
+Question model: one question of a lesson, stored as its own row.
+"""
+from sqlalchemy import Column, Integer, Text, ForeignKey, Index
+from sqlalchemy.orm import relationship, backref
+from ..database import Base
+
+class Question(Base):
+    __tablename__ = "questions"
+    __table_args__ = (
+        Index("ix_questions_lesson_question", "lesson_id", "question_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
+    question_id = Column(Integer, nullable=False)  # ID within the lesson
+    position = Column(Integer, nullable=False, default=0)  # display order within the lesson
+    prompt = Column(Text, nullable=False)
+    options = Column(Text, default="[]")  # JSON list of choices
+    answer = Column(Text, nullable=False)
+
+    lesson = relationship("Lesson", backref=backref("questions", order_by="Question.position"))
@@ -0,0 +1,22 @@
+"""
+MinHash signatures of questions and their LSH buckets, for near-duplicate checks (see app.content_audit).
+"""
+from sqlalchemy import BigInteger, Column, Integer, LargeBinary, SmallInteger, String
+from ..database import Base
+
+class QuestionSignature(Base):
+    __tablename__ = "question_signatures"
+
+    lesson_id = Column(Integer, primary_key=True)
+    question_id = Column(Integer, primary_key=True)
+    digest = Column(String, nullable=False)  # of the text the signature was computed from
+    signature = Column(LargeBinary, nullable=False)  # NUM_PERM little-endian uint32
+
+class QuestionBand(Base):
+    __tablename__ = "question_bands"
+
+    # Bucket first: lookups are by bucket alone
+    bucket = Column(BigInteger, primary_key=True)
+    band = Column(SmallInteger, primary_key=True)
+    lesson_id = Column(Integer, primary_key=True)
+    question_id = Column(Integer, primary_key=True)
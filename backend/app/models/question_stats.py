@@ -0,0 +1,21 @@
+"""
+Per-question answer counters, maintained incrementally as attempts are recorded.
+"""
+from sqlalchemy import Column, Integer, String
+from ..database import Base
+
+class QuestionStat(Base):
+    __tablename__ = "question_stats"
+
+    lesson_id = Column(Integer, primary_key=True)
+    question_id = Column(Integer, primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    misses = Column(Integer, nullable=False, default=0)
+
+class QuestionOptionStat(Base):
+    __tablename__ = "question_option_stats"
+
+    lesson_id = Column(Integer, primary_key=True)
+    question_id = Column(Integer, primary_key=True)
+    option = Column(String, primary_key=True)  # normalized answer as given
+    picks = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,109 @@
+"""
+SyncTombstone model and the listener that maintains per-user sync versions.
+
+Every flush that changes a user's profile, progress or mistakes takes the
+next value of users.sync_version with an atomic UPDATE ... RETURNING and
+stamps the changed rows with it. The user row stays locked until commit, so
+versions become visible in increasing order. Deleted rows leave a tombstone;
+tombstones are kept for SYNC_TOMBSTONE_RETENTION_DAYS, after which the
+user's sync_floor records that deletions before it can no longer be listed.
+"""
+import time
+from collections import defaultdict
+
+from sqlalchemy import Column, Integer, String, Float, Index, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from ..config import settings
+from ..database import Base
+from .user import User
+from .user_progress import UserProgress
+from .wrong_question import WrongQuestion
+
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+    __shard_key__ = "user_id"
+    __table_args__ = (
+        Index("ix_sync_tombstones_user_sync_version", "user_id", "sync_version"),
+        Index("ix_sync_tombstones_created_at", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)  # "progress" or "mistake"
+    row_id = Column(Integer, nullable=False)
+    sync_version = Column(Integer, nullable=False)
+    created_at = Column(Float, nullable=False, default=time.time)  # unix time
+
+
+SYNCED_KINDS = {UserProgress: "progress", WrongQuestion: "mistake"}
+# Completion bitmap: derived from progress and rebuilt lazily, so rewriting it changes nothing clients see
+UNSYNCED_USER_ATTRIBUTES = {"completed_lessons", "completed_layout"}
+
+
+def next_sync_version(session: Session, user_id: int):
+    """Atomically bump and return the user's sync_version, or None if the user is not stored yet."""
+    conn = session.connection(bind_arguments={"mapper": User.__mapper__})
+    users = User.__table__
+    bump = update(users).where(users.c.id == user_id).values(sync_version=users.c.sync_version + 1)
+    if conn.dialect.update_returning:
+        version = conn.execute(bump.returning(users.c.sync_version)).scalar()
+    else:
+        conn.execute(bump)
+        version = conn.execute(select(users.c.sync_version).where(users.c.id == user_id)).scalar()
+    user = session.identity_map.get(session.identity_key(User, user_id))
+    if user is not None and version is not None:
+        set_committed_value(user, "sync_version", version)
+    return version
+
+
+def _profile_modified(user: User) -> bool:
+    state = inspect(user)
+    return any(
+        state.attrs[prop.key].history.has_changes()
+        for prop in state.mapper.column_attrs
+        if prop.key not in UNSYNCED_USER_ATTRIBUTES
+    )
+
+
+def purge_tombstones(db: Session) -> int:
+    """Delete tombstones past their retention; returns how many. The caller commits.
+
+    Each affected user's sync_floor is raised to the newest version purged, so
+    a client that last synced before it gets a full resync instead of a delta
+    that silently misses those deletions.
+    """
+    expired = SyncTombstone.created_at < time.time() - settings.SYNC_TOMBSTONE_RETENTION_DAYS * 24 * 60 * 60
+    floors = db.query(SyncTombstone.user_id, func.max(SyncTombstone.sync_version)).filter(
+        expired
+    ).group_by(SyncTombstone.user_id).all()
+    users = User.__table__
+    for user_id, floor in floors:
+        db.execute(update(users).where(users.c.id == user_id, users.c.sync_floor < floor).values(sync_floor=floor))
+    return db.query(SyncTombstone).filter(expired).delete(synchronize_session=False)
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_sync_versions(session, flush_context, instances):
+    changed = defaultdict(list)
+    deleted = defaultdict(list)
+    for obj in session.new:
+        if type(obj) in SYNCED_KINDS:
+            changed[obj.user_id].append(obj)
+    for obj in session.dirty:
+        if type(obj) in SYNCED_KINDS and session.is_modified(obj, include_collections=False):
+            changed[obj.user_id].append(obj)
+        elif isinstance(obj, User) and _profile_modified(obj):
+            changed.setdefault(obj.id, [])
+    for obj in session.deleted:
+        if type(obj) in SYNCED_KINDS:
+            deleted[obj.user_id].append(obj)
+
+    for user_id in changed.keys() | deleted.keys():
+        version = next_sync_version(session, user_id)
+        if version is None:
+            continue
+        for row in changed[user_id]:
+            row.sync_version = version
+        for row in deleted[user_id]:
+            session.add(SyncTombstone(user_id=user_id, kind=SYNCED_KINDS[type(row)], row_id=row.id, sync_version=version))
@@ -0,0 +1,15 @@
+"""
+TaskReceipt model: records that an outbox task's shared-database writes were applied.
+"""
+from sqlalchemy import Column, Integer, Float, Index
+from ..database import Base
+
+class TaskReceipt(Base):
+    __tablename__ = "task_receipts"
+    __table_args__ = (
+        Index("ix_task_receipts_created_at", "created_at"),
+    )
+
+    shard = Column(Integer, primary_key=True)
+    task_id = Column(Integer, primary_key=True)  # task_outbox.id on that shard
+    created_at = Column(Float, nullable=False)  # unix time
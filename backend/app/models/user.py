@@ -1,13 +1,14 @@
 """
 User model representing a learner.
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Numeric, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __shard_key__ = "id"  # user-owned: lives on the user's shard
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -17,7 +18,7 @@ class User(Base):
     # Profile
     avatar_url = Column(String, default="")
     level = Column(Integer, default=1)
-    experience = Column(Integer, default=0)
+    experience = Column(Integer, default=0, index=True)
     hearts = Column(Integer, default=3)          # current hearts
     max_hearts = Column(Integer, default=5)      # maximum hearts possible
     coins = Column(Integer, default=0)
@@ -29,6 +30,14 @@ class User(Base):
     streak_count = Column(Integer, default=0)
     last_lesson_at = Column(DateTime(timezone=True), nullable=True)
     
+    # Completed lessons as a bitmap over the catalog's lesson order (see app.lesson_index)
+    completed_lessons = Column(LargeBinary, nullable=True)
+    completed_layout = Column(String, nullable=True)  # layout the bitmap was encoded against
+    
+    # Delta sync: bumped on every write to the profile, progress or mistakes
+    sync_version = Column(Integer, default=1, nullable=False)
+    sync_floor = Column(Integer, default=0, nullable=False)  # deletions up to this version are no longer listed
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_login = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,14 @@
+"""
+UserDirectory model: global user ids and their shard, kept in the shared database.
+"""
+from sqlalchemy import Column, Integer, String, Boolean
+from ..database import Base
+
+class UserDirectory(Base):
+    __tablename__ = "user_directory"
+
+    id = Column(Integer, primary_key=True, index=True)  # global user id
+    email = Column(String, unique=True, index=True, nullable=False)
+    username = Column(String, unique=True, index=True)
+    shard = Column(Integer, nullable=False, index=True)
+    moving = Column(Boolean, default=False, nullable=False)  # being rebalanced: writes are refused
@@ -1,12 +1,16 @@
 """
 Tracks a user's progress through lessons.
 """
-from sqlalchemy import Column, Integer, Boolean, ForeignKey, DateTime, func
+from sqlalchemy import Column, Integer, Boolean, ForeignKey, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from ..database import Base
 
 class UserProgress(Base):
     __tablename__ = "user_progress"
+    __shard_key__ = "user_id"
+    __table_args__ = (
+        Index("ix_user_progress_user_sync_version", "user_id", "sync_version"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -15,6 +19,7 @@ class UserProgress(Base):
     completed = Column(Boolean, default=False)
     best_score = Column(Integer, default=0)  # percentage
     last_attempt = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    sync_version = Column(Integer, default=0, nullable=False)  # user's sync_version at last change
 
     user = relationship("User", back_populates="progress")
     lesson = relationship("Lesson")
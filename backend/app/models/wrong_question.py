@@ -1,13 +1,21 @@
 """
 WrongQuestion model to track questions users answered incorrectly.
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
 class WrongQuestion(Base):
     __tablename__ = "wrong_questions"
+    __shard_key__ = "user_id"
+    __table_args__ = (
+        Index("ix_wrong_questions_user_sync_version", "user_id", "sync_version"),
+        Index("ix_wrong_questions_user_mastered", "user_id", "mastered"),
+        Index("uq_wrong_questions_user_question", "user_id", "lesson_id", "question_id", unique=True),
+        # Archived rows keep their id, so SQLite must not hand it out again
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -19,7 +27,29 @@ class WrongQuestion(Base):
     mastered = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_reviewed = Column(DateTime(timezone=True), nullable=True)
+    sync_version = Column(Integer, default=0, nullable=False)  # user's sync_version at last change
 
     # Relationships
     user = relationship("User", back_populates="wrong_questions")
     lesson = relationship("Lesson")
+
+class ArchivedWrongQuestion(Base):
+    """A mastered mistake moved out of wrong_questions; kept for history and analytics."""
+    __tablename__ = "wrong_questions_archive"
+    __shard_key__ = "user_id"
+    __table_args__ = (
+        Index("ix_wrong_questions_archive_user_id", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # id it had in wrong_questions
+    user_id = Column(Integer, nullable=False)
+    lesson_id = Column(Integer, nullable=False)
+    question_id = Column(Integer, nullable=False)
+    question_text = Column(String, nullable=False)
+    correct_answer = Column(String, nullable=False)
+    user_answer = Column(String, nullable=False)
+    mastered = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True))
+    last_reviewed = Column(DateTime(timezone=True), nullable=True)
+    sync_version = Column(Integer, default=0, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,14 @@
+"""
+Password hashing. Kept free of app imports so process-pool workers load it cheaply.
+"""
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def verify_password(plain_password, hashed_password):
+    # bcrypt has a 72-byte limit, truncate manually to avoid error
+    return pwd_context.verify(plain_password[:72], hashed_password)
+
+def get_password_hash(password):
+    # bcrypt has a 72-byte limit, truncate manually to avoid error
+    return pwd_context.hash(password[:72])
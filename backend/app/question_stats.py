@@ -0,0 +1,64 @@
+"""
+Batched upserts of per-question attempt, miss and option counters.
+
+Counts for a whole request are accumulated in memory and written with one
+multi-row upsert per table, so recording stats costs a fixed number of
+statements no matter how many questions were answered.
+"""
+from collections import Counter
+from typing import Dict, Iterable
+
+from sqlalchemy.orm import Session
+
+from .database import dialect_insert
+from .grading import normalize_answer
+from .models.question_stats import QuestionOptionStat, QuestionStat
+
+MAX_OPTION_LENGTH = 200
+
+
+def upsert_counters(db: Session, table, key_columns, counter_columns, rows, returning=()):
+    """Insert rows, or add their counter values to the existing rows with the same key.
+
+    With ``returning`` columns, pass a single row; the result holds its values after the update.
+    """
+    stmt = dialect_insert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={name: table.c[name] + stmt.excluded[name] for name in counter_columns},
+    )
+    if returning:
+        stmt = stmt.returning(*returning)
+    return db.execute(stmt, rows)
+
+
+class QuestionStatsBatch:
+    """Accumulates counters for one request; write() flushes them in one go."""
+
+    def __init__(self):
+        self.attempts = Counter()
+        self.misses = Counter()
+        self.picks = Counter()
+
+    def add_attempt(self, lesson_id: int, question_ids: Iterable[int], wrong_ids: Iterable[int], answers: Dict[int, str] = None):
+        """Count one attempt; ``answers`` (question_id -> raw answer) feeds the option counts."""
+        for question_id in question_ids:
+            self.attempts[lesson_id, question_id] += 1
+        for question_id in wrong_ids:
+            self.misses[lesson_id, question_id] += 1
+        for question_id, answer in (answers or {}).items():
+            option = normalize_answer(answer)[:MAX_OPTION_LENGTH]
+            if option:
+                self.picks[lesson_id, question_id, option] += 1
+
+    def write(self, db: Session):
+        if self.attempts:
+            upsert_counters(db, QuestionStat.__table__, ["lesson_id", "question_id"], ["attempts", "misses"], [
+                {"lesson_id": l, "question_id": q, "attempts": n, "misses": self.misses[l, q]}
+                for (l, q), n in self.attempts.items()
+            ])
+        if self.picks:
+            upsert_counters(db, QuestionOptionStat.__table__, ["lesson_id", "question_id", "option"], ["picks"], [
+                {"lesson_id": l, "question_id": q, "option": option, "picks": n}
+                for (l, q, option), n in self.picks.items()
+            ])
@@ -0,0 +1,198 @@
+"""
+Per-attempt question sampling from large lesson pools.
+
+Each lesson's questions are held as a compact pool: question ids in lesson
+order and the running total of their weights. A question's weight grows
+with how often learners miss it, per question_stats when the pool was
+loaded. Starting a lesson draws LESSON_SAMPLE_SIZE distinct questions by
+binary search over the running totals; the user's unmastered mistakes in
+the lesson count LESSON_MISS_WEIGHT times. Lessons no larger than the
+sample serve every question.
+
+The questions served go into a signed attempt token, so grading and
+submissions can be checked against what was actually asked. Each token
+can be used once: its id is stored in the idempotency table, alongside
+the request's writes, until the token expires.
+"""
+import heapq
+import random
+import secrets
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Collection, Dict, List, Optional
+
+from fastapi import HTTPException
+from jose import JWTError, jwt
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .catalog import versioned
+from .config import settings
+from .database import SessionLocal
+from .models.idempotency_key import IdempotencyKey
+from .models.lesson import Lesson
+from .models.question import Question
+from .models.question_stats import QuestionStat
+from .models.wrong_question import WrongQuestion
+
+# Base weight is BASE_WEIGHT plus the question's smoothed miss rate
+BASE_WEIGHT = 0.5
+TOKEN_TYPE = "attempt"
+
+
+class QuestionPool:
+    __slots__ = ("ids", "cumulative", "positions")
+
+    def __init__(self, ids: List[int], weights: List[float]):
+        self.ids = array("i", ids)
+        self.cumulative = array("d", accumulate(weights))
+        self.positions = {question_id: i for i, question_id in enumerate(ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def weight(self, i: int) -> float:
+        return self.cumulative[i] - (self.cumulative[i - 1] if i else 0.0)
+
+    def sample(self, k: int, misses: Collection[int] = (), rng=random) -> List[int]:
+        """k distinct question ids in lesson order, weighted, with ``misses`` boosted."""
+        n = len(self.ids)
+        if k >= n:
+            return list(self.ids)
+        boost = settings.LESSON_MISS_WEIGHT
+        missed = [i for i in (self.positions.get(q) for q in misses) if i is not None]
+        if k * 2 > n:
+            # Drawing most of the pool: rejection would keep hitting chosen
+            # questions, so rank them all by weighted random keys instead
+            weights = [self.weight(i) for i in range(n)]
+            for i in missed:
+                weights[i] *= boost
+            chosen = heapq.nlargest(k, range(n), key=lambda i: rng.random() ** (1 / weights[i]))
+        else:
+            base_total = self.cumulative[-1]
+            extra = array("d", accumulate(self.weight(i) * (boost - 1) for i in missed))
+            total = base_total + (extra[-1] if extra else 0.0)
+            chosen = set()
+            while len(chosen) < k:
+                u = rng.random() * total
+                if u < base_total:
+                    i = min(bisect_right(self.cumulative, u), n - 1)
+                else:
+                    i = missed[min(bisect_right(extra, u - base_total), len(missed) - 1)]
+                chosen.add(i)
+        return [self.ids[i] for i in sorted(chosen)]
+
+
+class QuestionPools:
+    """Pools per lesson, loaded lazily for one content version."""
+
+    def __init__(self):
+        self._lessons: Dict[int, Optional[QuestionPool]] = {}
+        self._lock = threading.Lock()
+
+    def for_lesson(self, lesson_id: int) -> Optional[QuestionPool]:
+        """The lesson's pool, or None if the lesson does not exist."""
+        try:
+            return self._lessons[lesson_id]
+        except KeyError:
+            pass
+        db = SessionLocal()
+        try:
+            pool = self._load(db, lesson_id)
+        finally:
+            db.close()
+        with self._lock:
+            self._lessons[lesson_id] = pool
+        return pool
+
+    def load_all(self, db: Session) -> "QuestionPools":
+        """Load every lesson's pool in three queries, e.g. before forking workers."""
+        ids = {lesson_id: [] for (lesson_id,) in db.query(Lesson.id)}
+        for lesson_id, question_id in db.query(Question.lesson_id, Question.question_id).order_by(
+            Question.lesson_id, Question.position, Question.question_id
+        ):
+            if lesson_id in ids:
+                ids[lesson_id].append(question_id)
+        stats = {
+            (row.lesson_id, row.question_id): (row.misses + 1) / (row.attempts + 2)
+            for row in db.query(QuestionStat.lesson_id, QuestionStat.question_id, QuestionStat.misses, QuestionStat.attempts)
+        }
+        pools = {
+            lesson_id: QuestionPool(
+                question_ids, [BASE_WEIGHT + stats.get((lesson_id, question_id), 0.5) for question_id in question_ids]
+            )
+            for lesson_id, question_ids in ids.items()
+        }
+        with self._lock:
+            self._lessons.update(pools)
+        return self
+
+    @staticmethod
+    def _load(db: Session, lesson_id: int) -> Optional[QuestionPool]:
+        if db.query(Lesson.id).filter(Lesson.id == lesson_id).first() is None:
+            return None
+        ids = [
+            question_id for (question_id,) in db.query(Question.question_id)
+            .filter(Question.lesson_id == lesson_id).order_by(Question.position, Question.question_id)
+        ]
+        stats = {
+            row.question_id: (row.misses + 1) / (row.attempts + 2)
+            for row in db.query(QuestionStat).filter(QuestionStat.lesson_id == lesson_id)
+        }
+        return QuestionPool(ids, [BASE_WEIGHT + stats.get(question_id, 0.5) for question_id in ids])
+
+
+def question_pools() -> QuestionPools:
+    return versioned("question_pools", lambda db: QuestionPools())
+
+
+def unmastered_misses(db: Session, user_id: int, lesson_id: int) -> List[int]:
+    return [
+        question_id for (question_id,) in db.query(WrongQuestion.question_id).filter(
+            WrongQuestion.user_id == user_id,
+            WrongQuestion.mastered == False,
+            WrongQuestion.lesson_id == lesson_id,
+        )
+    ]
+
+
+def attempt_token(user_id: int, lesson_id: int, question_ids: List[int]) -> str:
+    expire = datetime.utcnow() + timedelta(minutes=settings.ATTEMPT_TOKEN_EXPIRE_MINUTES)
+    claims = {
+        "typ": TOKEN_TYPE, "sub": str(user_id), "lesson": lesson_id, "q": question_ids,
+        "exp": expire, "jti": secrets.token_urlsafe(16),
+    }
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def attempt_claims(token: str, user_id: int, lesson_id: int) -> Optional[dict]:
+    """The attempt token's claims, or None if it is invalid, expired or not this user's lesson."""
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if claims.get("typ") != TOKEN_TYPE or claims.get("sub") != str(user_id) or claims.get("lesson") != lesson_id:
+        return None
+    return claims
+
+
+def consume_attempt(db: Session, user_id: int, claims: dict):
+    """Record the token as used in the request's transaction; raises 409 if it already was."""
+    if "jti" not in claims:
+        return  # issued before tokens were single-use; expires within ATTEMPT_TOKEN_EXPIRE_MINUTES
+    key = (user_id, f"attempt:{claims['jti']}")
+    if db.get(IdempotencyKey, key) is None:
+        db.add(IdempotencyKey(
+            user_id=user_id, key=key[1], endpoint="lessons.attempt",
+            fingerprint="", response="null", expires_at=int(claims["exp"]),
+        ))
+        try:
+            # A concurrent use of the same token fails here, before any other writes
+            db.flush()
+            return
+        except IntegrityError:
+            db.rollback()
+    raise HTTPException(status_code=409, detail="This attempt was already submitted; start the lesson again")
@@ -0,0 +1,202 @@
+"""
+Full-text search over levels, lessons and questions.
+
+An in-process inverted index, built from the catalog tables and rebuilt
+when the content version changes. Text is normalized (accents stripped,
+case folded, apostrophes dropped) and split into word tokens. Each posting
+stores its BM25 weight, so scoring a query is a sum over the matching
+postings. A document must match every query token; the last token also
+matches as a prefix, for search-as-you-type.
+"""
+import heapq
+import math
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .catalog import versioned
+from .models.lesson import Lesson
+from .models.level import Level
+from .models.question import Question
+
+KINDS = ("level", "lesson", "question")
+# Titles count this many times over body text
+TITLE_WEIGHT = 3
+# Prefixes shorter than this only match whole words
+MIN_PREFIX = 2
+# Terms a prefix may expand to, most frequent first
+MAX_EXPANSIONS = 32
+# Prefix matches score less than whole-word matches
+PREFIX_DISCOUNT = 0.8
+# Tokens in more than this share of documents neither rank nor filter
+# usefully; they are skipped when the query has rarer tokens
+COMMON_SHARE = 0.5
+K1, B = 1.2, 0.75
+
+_WORD = re.compile(r"\w+")
+_APOSTROPHES = str.maketrans("", "", "'’")
+
+
+def tokenize(text: str) -> List[str]:
+    text = text or ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return _WORD.findall(text.casefold().translate(_APOSTROPHES))
+
+
+# A document: kind, level id, lesson id, question id, title and question text
+Doc = Tuple[str, int, Optional[int], Optional[int], str, Optional[str]]
+
+
+class SearchIndex:
+    def __init__(self):
+        self.docs: List[Doc] = []  # by dense document number
+        self._lengths = array("f")
+        self.terms: List[str] = []  # sorted, for prefix lookups
+        # term -> (doc numbers ascending, weights); the weights are term
+        # frequencies while building and BM25 weights once finished
+        self._postings = {}
+
+    def add(self, doc: Doc, title: str, body: str):
+        number = len(self.docs)
+        self.docs.append(doc)
+        counts = {}
+        for weight, text in ((TITLE_WEIGHT, title), (1, body)):
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + weight
+        for token, count in counts.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = (array("i"), array("f"))
+            postings[0].append(number)
+            postings[1].append(count)
+        self._lengths.append(sum(counts.values()))
+
+    def finish(self) -> "SearchIndex":
+        n = len(self.docs)
+        average = (sum(self._lengths) / n) if n else 1.0
+        norms = [K1 * (1 - B + B * length / average) for length in self._lengths]
+        for docs, weights in self._postings.values():
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for i, (doc, tf) in enumerate(zip(docs, weights)):
+                weights[i] = idf * tf * (K1 + 1) / (tf + norms[doc])
+        self.terms = sorted(self._postings)
+        self._lengths = array("f")
+        return self
+
+    def _expand(self, token: str, prefix: bool) -> List[Tuple[str, float]]:
+        """Index terms the query token matches, with their score factor."""
+        matches = [(token, 1.0)] if token in self._postings else []
+        if prefix and len(token) >= MIN_PREFIX:
+            start = bisect_left(self.terms, token)
+            extended = []
+            for term in self.terms[start:]:
+                if not term.startswith(token):
+                    break
+                if term != token:
+                    extended.append(term)
+            extended.sort(key=lambda term: len(self._postings[term][0]), reverse=True)
+            matches += [(term, PREFIX_DISCOUNT) for term in extended[:MAX_EXPANSIONS]]
+        return matches
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 20, offset: int = 0) -> Tuple[int, List[Tuple[float, Doc]]]:
+        """(number of matches, the requested page of (score, document)), best first."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        groups = []
+        for i, token in enumerate(tokens):
+            last = i == len(tokens) - 1 and not query[-1:].isspace()
+            matches = self._expand(token, prefix=last)
+            if not matches:
+                if last and len(token) < MIN_PREFIX:
+                    continue  # still being typed
+                return 0, []
+            group = [(self._postings[term], factor) for term, factor in matches]
+            groups.append((sum(len(docs) for (docs, _), _ in group), group))
+        if not groups:
+            return 0, []
+        groups.sort(key=lambda item: item[0])
+        common = len(self.docs) * COMMON_SHARE
+        groups = [group for size, group in groups if size <= common] or [groups[0][1]]
+
+        if len(groups) == 1 and kind is None:
+            return self._search_one(groups[0], offset + limit, offset)
+
+        # Candidates come from the rarest token; the others only narrow them down
+        scores = self._best_weights(groups[0])
+        for group in groups[1:]:
+            if sum(len(docs) for (docs, _), _ in group) < len(scores) * len(group) * 8:
+                found = self._best_weights(group, among=scores)
+            else:
+                found = {}
+                for doc in scores:
+                    best = 0.0
+                    for (docs, weights), factor in group:
+                        i = bisect_left(docs, doc)
+                        if i < len(docs) and docs[i] == doc:
+                            best = max(best, weights[i] * factor)
+                    if best:
+                        found[doc] = best
+            scores = {doc: scores[doc] + weight for doc, weight in found.items()}
+            if not scores:
+                return 0, []
+
+        if kind is not None:
+            scores = {doc: score for doc, score in scores.items() if self.docs[doc][0] == kind}
+        best = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return len(scores), [(score, self.docs[doc]) for doc, score in best[offset:]]
+
+    def _search_one(self, group, count: int, offset: int) -> Tuple[int, list]:
+        # A document's best weight is within the top ``count`` of the term it
+        # comes from, so only those need merging
+        best = {}
+        for (docs, weights), factor in group:
+            for weight, doc in heapq.nlargest(count, zip(weights, docs)):
+                weight *= factor
+                if weight > best.get(doc, 0.0):
+                    best[doc] = weight
+        total = len(group[0][0][0]) if len(group) == 1 else len(set().union(*(docs for (docs, _), _ in group)))
+        top = heapq.nlargest(count, best.items(), key=lambda item: (item[1], -item[0]))
+        return total, [(score, self.docs[doc]) for doc, score in top[offset:]]
+
+    @staticmethod
+    def _best_weights(group, among: Optional[dict] = None) -> dict:
+        """doc -> best weight over the group's terms, optionally only for docs in ``among``."""
+        best = {}
+        for (docs, weights), factor in group:
+            for doc, weight in zip(docs, weights):
+                if among is not None and doc not in among:
+                    continue
+                weight *= factor
+                if weight > best.get(doc, 0.0):
+                    best[doc] = weight
+        return best
+
+
+def build_search_index(db: Session) -> SearchIndex:
+    """Index every level, lesson and question, in three queries."""
+    index = SearchIndex()
+    for level in db.query(Level.id, Level.title, Level.description).order_by(Level.order):
+        index.add(("level", level.id, None, None, level.title, None), level.title, level.description)
+    lessons = {}
+    for lesson in db.query(Lesson.id, Lesson.level_id, Lesson.title, Lesson.description).order_by(Lesson.level_id, Lesson.order):
+        lessons[lesson.id] = lesson
+        index.add(("lesson", lesson.level_id, lesson.id, None, lesson.title, None), lesson.title, lesson.description)
+    for q in db.query(Question.lesson_id, Question.question_id, Question.prompt, Question.options, Question.answer).order_by(
+        Question.lesson_id, Question.position
+    ):
+        lesson = lessons.get(q.lesson_id)
+        if lesson is not None:
+            index.add(
+                ("question", lesson.level_id, lesson.id, q.question_id, lesson.title, q.prompt),
+                q.prompt, f"{q.options or ''} {q.answer}",
+            )
+    return index.finish()
+
+
+def search_index() -> SearchIndex:
+    return versioned("search_index", build_search_index)
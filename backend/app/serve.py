@@ -0,0 +1,164 @@
+"""
+Prefork production server.
+
+    python -m app.serve
+
+The parent imports the app (creating tables once), builds the read-only
+catalog indexes, freezes the GC so those objects are never written to
+again, and binds the listening socket. Workers are then forked and share
+the preloaded memory copy-on-write. A worker that exits, for instance
+after SERVER_MAX_REQUESTS, is replaced. SIGTERM or SIGINT stops the
+workers gracefully, giving them SERVER_GRACEFUL_TIMEOUT seconds to finish
+in-flight requests.
+"""
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import time
+
+import uvicorn
+
+from .config import settings
+
+logger = logging.getLogger("app.serve")
+
+
+def preload():
+    """Import the app and build the per-process caches workers would otherwise each build."""
+    from .main import app
+    from .api.lessons import compressed_catalog
+    from .bundles import bundle_manifest
+    from .database import SessionLocal
+    from .grading import answer_keys
+    from .lesson_index import lesson_sequence
+    from .sampling import question_pools
+    from .search import search_index
+
+    compressed_catalog()
+    lesson_sequence()
+    search_index()
+    bundle_manifest()
+    # Answer keys and question pools otherwise load lazily, per lesson and per worker
+    db = SessionLocal()
+    try:
+        answer_keys().load_all(db)
+        question_pools().load_all(db)
+    finally:
+        db.close()
+    return app
+
+
+def _dispose_engines(close: bool):
+    from . import sharding
+    from .database import engine, replica_engines
+
+    for bind in (engine, *replica_engines, *sharding.shard_engines):
+        bind.dispose(close=close)
+
+
+def _bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in settings.SERVER_HOST else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((settings.SERVER_HOST, settings.SERVER_PORT))
+    sock.listen(settings.SERVER_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket):
+    # Pooled connections were opened by the parent; drop them without closing its sockets
+    _dispose_engines(close=False)
+    random.seed()
+    max_requests = None
+    if settings.SERVER_MAX_REQUESTS:
+        max_requests = settings.SERVER_MAX_REQUESTS + random.randint(0, settings.SERVER_MAX_REQUESTS_JITTER)
+    config = uvicorn.Config(
+        app,
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT,
+        backlog=settings.SERVER_BACKLOG,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _run_worker(app, sock)
+        except BaseException:
+            logger.exception("Worker crashed")
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(message)s")
+    started = time.monotonic()
+    app = preload()
+    # Nothing opened during preload may be shared with the workers
+    _dispose_engines(close=True)
+    # Preloaded objects move to the permanent generation, so collections in
+    # the workers never touch (and copy) their pages
+    gc.collect()
+    gc.freeze()
+    sock = _bind_socket()
+    logger.info("Preloaded in %.2fs, listening on %s:%d", time.monotonic() - started, settings.SERVER_HOST, settings.SERVER_PORT)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers = {}  # pid -> start time
+    while not stopping:
+        while len(workers) < settings.SERVER_WORKERS:
+            pid = _spawn(app, sock)
+            workers[pid] = time.monotonic()
+            logger.info("Started worker %d", pid)
+        # Polled, since blocking waits are retried rather than interrupted by signals
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if not pid:
+            time.sleep(0.2)
+            continue
+        started_at = workers.pop(pid, None)
+        code = os.waitstatus_to_exitcode(status)
+        logger.info("Worker %d exited with status %d; replacing it", pid, code)
+        if code != 0 and started_at is not None and time.monotonic() - started_at < 1:
+            # Failing on startup; don't respawn in a tight loop
+            time.sleep(1)
+
+    logger.info("Stopping %d workers", len(workers))
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + settings.SERVER_GRACEFUL_TIMEOUT + 5
+    while workers and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in workers:
+        logger.warning("Worker %d did not stop in time; killing it", pid)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
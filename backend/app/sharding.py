@@ -0,0 +1,437 @@
+"""
+User-partitioned database routing.
+
+Models that declare ``__shard_key__`` (users, user_progress, wrong_questions)
+are user-owned and live on one of the SHARD_DATABASE_URLS databases. Everything
+else, including the lesson catalog and the user directory, stays in the shared
+DATABASE_URL database. The directory records each user's shard, so the router
+is only consulted when a user is created or rebalanced.
+
+Processes cache directory entries for SHARD_DIRECTORY_CACHE_SECONDS, so a
+rebalance fences the users it moves: it flags them as moving, waits until no
+process can still hold an entry from before the flag, and only then copies
+their rows. Sessions routed to a moving user refuse writes with a 503, and
+background tasks for the user wait until the move is done.
+"""
+import heapq
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import MetaData, Table, create_engine, delete, event, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import Base, SessionLocal, _connect_args, engine
+
+shard_engines = [
+    create_engine(url, connect_args=_connect_args(url), echo=True)
+    for url in settings.SHARD_DATABASE_URLS
+]
+
+
+class ShardRouter:
+    """Maps a global user id to a shard index. Subclass to change placement."""
+
+    def __init__(self, shard_count: int):
+        self.shard_count = shard_count
+
+    def shard_for(self, user_id: int) -> int:
+        raise NotImplementedError
+
+
+class ModuloShardRouter(ShardRouter):
+    def shard_for(self, user_id: int) -> int:
+        return user_id % self.shard_count
+
+
+def load_router(path: str, shard_count: int) -> ShardRouter:
+    module_name, _, class_name = path.partition(":")
+    router_class = getattr(importlib.import_module(module_name), class_name)
+    return router_class(shard_count)
+
+
+router = load_router(settings.SHARD_ROUTER, len(shard_engines)) if shard_engines else None
+
+# email -> (shard, moving, monotonic expiry)
+_directory_cache = {}
+_directory_lock = threading.Lock()
+_scatter_pool = ThreadPoolExecutor(max_workers=max(1, len(shard_engines)), thread_name_prefix="shard")
+
+
+def is_enabled() -> bool:
+    return bool(shard_engines)
+
+
+def user_owned_models() -> list:
+    """User-owned model classes, parents before children."""
+    order = {table: i for i, table in enumerate(Base.metadata.sorted_tables)}
+    models = [
+        mapper.class_ for mapper in Base.registry.mappers
+        if getattr(mapper.class_, "__shard_key__", None)
+    ]
+    return sorted(models, key=lambda model: order[model.__table__])
+
+
+def shard_metadata(tables: List[Table]) -> MetaData:
+    """Copies of the user-owned tables for shard DDL.
+
+    Foreign keys to shared tables (lessons.id) are left out: those tables
+    live in the shared database, and databases that enforce foreign keys
+    would refuse to create the shard tables.
+    """
+    metadata = MetaData()
+    names = {table.name for table in tables}
+    for table in tables:
+        copy = table.to_metadata(metadata)
+        for constraint in list(copy.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split(".")[0] in names:
+                continue
+            copy.constraints.discard(constraint)
+            for foreign_key in constraint.elements:
+                foreign_key.parent.foreign_keys.discard(foreign_key)
+                copy.foreign_keys.discard(foreign_key)
+    return metadata
+
+
+def create_all():
+    """Create shared tables on the shared database and user-owned ones on every shard."""
+    user_tables = [model.__table__ for model in user_owned_models()]
+    shared_tables = [t for t in Base.metadata.sorted_tables if t not in user_tables]
+    Base.metadata.create_all(bind=engine, tables=shared_tables)
+    metadata = shard_metadata(user_tables)
+    for shard_engine in shard_engines:
+        metadata.create_all(bind=shard_engine)
+
+
+def route_session(db: Session, shard: int):
+    """Bind the session's user-owned models to the given shard."""
+    for model in user_owned_models():
+        db.bind_mapper(model, shard_engines[shard])
+    db.info["shard"] = shard
+
+
+def _directory_entry(email: str) -> Optional[Tuple[int, bool]]:
+    from .models.user_directory import UserDirectory
+
+    now = time.monotonic()
+    with _directory_lock:
+        cached = _directory_cache.get(email)
+    if cached and cached[2] > now:
+        return cached[:2]
+    db = SessionLocal()
+    try:
+        entry = db.query(UserDirectory.shard, UserDirectory.moving).filter(UserDirectory.email == email).first()
+    finally:
+        db.close()
+    if entry is None:
+        return None
+    with _directory_lock:
+        _directory_cache[email] = (entry.shard, entry.moving, now + settings.SHARD_DIRECTORY_CACHE_SECONDS)
+    return entry.shard, entry.moving
+
+
+def shard_for_email(email: str) -> Optional[int]:
+    entry = _directory_entry(email)
+    return entry[0] if entry else None
+
+
+def forget_email(email: str):
+    with _directory_lock:
+        _directory_cache.pop(email, None)
+
+
+def user_location(user_id: int) -> Optional[Tuple[int, bool]]:
+    """The user's (shard, moving) straight from the directory, bypassing the cache."""
+    from .models.user_directory import UserDirectory
+
+    with SessionLocal() as db:
+        entry = db.query(UserDirectory.shard, UserDirectory.moving).filter(UserDirectory.id == user_id).first()
+    return tuple(entry) if entry else None
+
+
+def route_session_for_subject(db: Session, subject: Optional[str]) -> Optional[int]:
+    """Route the session to the shard of the user with this email, if known."""
+    if subject is None:
+        return None
+    entry = _directory_entry(subject)
+    if entry is None:
+        return None
+    shard, moving = entry
+    route_session(db, shard)
+    if moving:
+        db.info["moving"] = True
+    return shard
+
+
+def _refuse_write_while_moving(session: Session):
+    if session.info.get("moving"):
+        raise HTTPException(
+            status_code=503,
+            detail="This account is being moved; try again shortly",
+            headers={"Retry-After": str(round(settings.SHARD_DIRECTORY_CACHE_SECONDS + settings.SHARD_MOVE_GRACE_SECONDS))},
+        )
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _fence_flush(session, flush_context, instances):
+    _refuse_write_while_moving(session)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _fence_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _refuse_write_while_moving(orm_execute_state.session)
+
+
+def directory_conflict(db: Session, email: Optional[str], username: Optional[str], exclude_id: Optional[int] = None):
+    """Return the directory entry already using this email or username, if any."""
+    from .models.user_directory import UserDirectory
+
+    clauses = []
+    if email is not None:
+        clauses.append(UserDirectory.email == email)
+    if username is not None:
+        clauses.append(UserDirectory.username == username)
+    if not clauses:
+        return None
+    query = db.query(UserDirectory).filter(or_(*clauses))
+    if exclude_id is not None:
+        query = query.filter(UserDirectory.id != exclude_id)
+    return query.first()
+
+
+def allocate_user(db: Session, email: str, username: str) -> int:
+    """Reserve a global user id, pick its shard and route the session there."""
+    from .models.user_directory import UserDirectory
+
+    entry = UserDirectory(email=email, username=username, shard=0)
+    db.add(entry)
+    db.flush()
+    entry.shard = router.shard_for(entry.id)
+    route_session(db, entry.shard)
+    return entry.id
+
+
+def update_directory(db: Session, user_id: int, old_email: str, **fields):
+    from .models.user_directory import UserDirectory
+
+    db.query(UserDirectory).filter(UserDirectory.id == user_id).update(fields)
+    forget_email(old_email)
+
+
+@contextmanager
+def shard_session(shard: int) -> Iterator[Session]:
+    db = SessionLocal()
+    route_session(db, shard)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def scatter(fn: Callable[[Session], list]) -> List[list]:
+    """Run fn against every shard in parallel and return the per-shard results."""
+    def run(shard):
+        with shard_session(shard) as db:
+            return fn(db)
+    return list(_scatter_pool.map(run, range(len(shard_engines))))
+
+
+def top_users(limit: int) -> list:
+    """Scatter-gather the globally highest-experience users."""
+    from .models.user import User
+
+    per_shard = scatter(
+        lambda db: db.query(User).order_by(User.experience.desc()).limit(limit).all()
+    )
+    return heapq.nlargest(limit, (u for users in per_shard for u in users), key=lambda u: u.experience)
+
+
+def _copy_mistakes(user_id: int, src, dst) -> int:
+    """Copy hot and archived mistakes, numbered from the target's wrong_questions sequence.
+
+    An archived row keeps the id it had in wrong_questions, and the mastered
+    list pages through both tables by id, so both get new ids from the same
+    sequence, in their original order. Each archived row passes through
+    wrong_questions on its own, which keeps the unique notebook index satisfied.
+    """
+    from .models.wrong_question import ArchivedWrongQuestion, WrongQuestion
+
+    hot, archive = WrongQuestion.__table__, ArchivedWrongQuestion.__table__
+    rows = [(row, False) for row in src.execute(select(hot).where(hot.c.user_id == user_id)).mappings()]
+    rows += [(row, True) for row in src.execute(select(archive).where(archive.c.user_id == user_id)).mappings()]
+    rows.sort(key=lambda item: item[0]["id"])
+    columns = [column.name for column in hot.c if column.name != "id"]
+    for row, archived in rows:
+        new_id = dst.execute(
+            insert(hot).values({name: row[name] for name in columns}).returning(hot.c.id)
+        ).scalar_one()
+        if archived:
+            dst.execute(delete(hot).where(hot.c.id == new_id))
+            dst.execute(insert(archive).values({**row, "id": new_id}))
+    return len(rows)
+
+
+def _copy_user_rows(user_id: int, source, target) -> int:
+    """Copy one user's rows from source to target engine; returns rows copied.
+
+    Surrogate ids are per shard, so copied rows get new ones. Tombstones refer
+    to the old ids and are not copied; the user's sync_version is bumped past
+    a new sync_floor instead, so every client's next sync is a full one.
+    """
+    from .models.sync_tombstone import SyncTombstone
+    from .models.user import User
+    from .models.wrong_question import ArchivedWrongQuestion, WrongQuestion
+
+    remapped = {WrongQuestion.__table__, ArchivedWrongQuestion.__table__, SyncTombstone.__table__}
+    copied = 0
+    with source.connect() as src, target.begin() as dst:
+        # Rows left on the target by an interrupted move
+        _delete_rows(dst, user_id)
+        for model in user_owned_models():
+            table = model.__table__
+            if table in remapped:
+                continue
+            key = model.__shard_key__
+            rows = src.execute(select(table).where(table.c[key] == user_id)).mappings().all()
+            if not rows:
+                continue
+            surrogate = table.autoincrement_column
+            drop = surrogate.name if surrogate is not None and surrogate.name != key else None
+            dst.execute(insert(table), [{k: v for k, v in row.items() if k != drop} for row in rows])
+            copied += len(rows)
+        copied += _copy_mistakes(user_id, src, dst)
+        users = User.__table__
+        dst.execute(update(users).where(users.c.id == user_id).values(
+            sync_version=users.c.sync_version + 1, sync_floor=users.c.sync_version + 1,
+        ))
+    return copied
+
+
+def _delete_rows(conn, user_id: int):
+    for model in reversed(user_owned_models()):
+        table = model.__table__
+        conn.execute(delete(table).where(table.c[model.__shard_key__] == user_id))
+
+
+def _delete_user_rows(user_id: int, shard_engine):
+    with shard_engine.begin() as conn:
+        _delete_rows(conn, user_id)
+
+
+def _wait_for_directory_caches(wait: bool):
+    """Sleep until entries cached before now have expired everywhere, and requests using them are done."""
+    if wait:
+        time.sleep(settings.SHARD_DIRECTORY_CACHE_SECONDS + settings.SHARD_MOVE_GRACE_SECONDS)
+
+
+def _release_task_leases(user_id: int, shard_engine):
+    """Revoke leases on the user's pending tasks, so a run still in progress cannot commit."""
+    from .models.outbox_task import OutboxTask
+
+    outbox = OutboxTask.__table__
+    with shard_engine.begin() as conn:
+        conn.execute(update(outbox).where(
+            outbox.c.user_id == user_id, outbox.c.processed_at.is_(None)
+        ).values(claimed_until=None))
+
+
+def _check_shard(shard: int, what: str):
+    if not 0 <= shard < len(shard_engines):
+        raise ValueError(
+            f"{what} is shard {shard}, but SHARD_DATABASE_URLS lists {len(shard_engines)}; "
+            "keep shards configured until they are drained"
+        )
+
+
+def rebalance(batch_size: int = 500, dry_run: bool = False, log=print, wait: bool = True) -> int:
+    """Move every user whose directory shard differs from the router's choice.
+
+    Each batch is fenced: its users are flagged as moving, which refuses their
+    writes, and the copy starts once every process has seen the flag. The
+    directory then points at the new shard, and the old rows are deleted once
+    no process can still read them. Pass ``wait=False`` only when the app and
+    the task workers are stopped.
+    """
+    from .models.user_directory import UserDirectory
+
+    moved = 0
+    last_id = 0
+    while True:
+        with SessionLocal() as db:
+            entries = db.query(UserDirectory).filter(UserDirectory.id > last_id).order_by(UserDirectory.id).limit(batch_size).all()
+            if not entries:
+                return moved
+            last_id = entries[-1].id
+            moves = []
+            for entry in entries:
+                target = router.shard_for(entry.id)
+                _check_shard(entry.shard, f"user {entry.id}'s directory entry")
+                _check_shard(target, f"the router's choice for user {entry.id}")
+                if target != entry.shard:
+                    moves.append((entry, entry.shard, target))
+                elif entry.moving:
+                    # Fence left by an interrupted run whose move is no longer wanted
+                    entry.moving = False
+            for entry, source, target in moves:
+                log(f"user {entry.id}: shard {source} -> {target}")
+            moved += len(moves)
+            if dry_run:
+                continue
+
+            for entry, _, _ in moves:
+                entry.moving = True
+            db.commit()
+            if not moves:
+                continue
+            _wait_for_directory_caches(wait)
+
+            # Copy, then repoint the directory and lift the fence together
+            for entry, source, target in moves:
+                _release_task_leases(entry.id, shard_engines[source])
+                _copy_user_rows(entry.id, shard_engines[source], shard_engines[target])
+            for entry, source, target in moves:
+                entry.shard = target
+                entry.moving = False
+            db.commit()
+            for entry, _, _ in moves:
+                forget_email(entry.email)
+
+            # Processes may still read from the old shard until their entries expire
+            _wait_for_directory_caches(wait)
+            for entry, source, _ in moves:
+                _delete_user_rows(entry.id, shard_engines[source])
+
+
+def import_unsharded(batch_size: int = 500, log=print) -> int:
+    """Copy users from the shared (formerly single) database into the shards."""
+    from .models.user import User
+    from .models.user_directory import UserDirectory
+
+    imported = 0
+    last_id = 0
+    while True:
+        with engine.connect() as conn:
+            users = conn.execute(
+                select(User.__table__.c.id, User.__table__.c.email, User.__table__.c.username)
+                .where(User.__table__.c.id > last_id).order_by(User.__table__.c.id).limit(batch_size)
+            ).all()
+        if not users:
+            return imported
+        last_id = users[-1].id
+        with SessionLocal() as db:
+            known = {row.id for row in db.query(UserDirectory.id).filter(UserDirectory.id.in_([u.id for u in users]))}
+            for user in users:
+                if user.id in known:
+                    continue
+                shard = router.shard_for(user.id)
+                _copy_user_rows(user.id, engine, shard_engines[shard])
+                db.add(UserDirectory(id=user.id, email=user.email, username=user.username, shard=shard))
+                imported += 1
+            db.commit()
+        log(f"imported users up to id {last_id}")
@@ -0,0 +1,313 @@
+"""
+Background task pipeline backed by a durable outbox.
+
+Request handlers call enqueue() before committing, so the task row is saved
+atomically with the request's own writes. Once the commit succeeds, the task
+id goes onto a bounded in-process queue served by a pool of worker threads.
+A sweeper rescans the outbox and re-queues tasks that were never picked up
+(full queue, crashed process) or whose worker lease ran out. Every task
+therefore runs at least once. A run's writes are committed together with
+marking the task processed, and only while the run still holds its lease,
+so a worker that overran TASK_LEASE_SECONDS discards its work instead of
+applying it a second time. Handlers must do all their writes through the
+session they are given and must not commit.
+
+With sharding the outbox lives on the user's shard, and a commit cannot span
+the shard and the shared database. Handlers pass writes to shared tables to
+defer_shared(); they are committed, together with a TaskReceipt for the task,
+just before the shard transaction, and skipped when a receipt shows an
+earlier run already applied them.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import event, func, inspect, or_
+from sqlalchemy.orm import Session
+
+from . import sharding
+from .config import settings
+from .database import SessionLocal, dialect_insert
+from .idempotency import purge_expired
+from .models.outbox_task import OutboxTask
+from .models.task_receipt import TaskReceipt
+from .models.sync_tombstone import purge_tombstones
+
+logger = logging.getLogger(__name__)
+
+_handlers: Dict[str, Callable[[Session, int, dict], None]] = {}
+_queue: "queue.Queue" = queue.Queue(maxsize=settings.TASK_QUEUE_SIZE)
+_queued = set()  # (shard, task id) currently in _queue
+_queued_lock = threading.Lock()
+_threads = []
+_stopping = threading.Event()
+_stats = {"processed": 0, "failed": 0, "lease_lost": 0, "overflowed": 0, "last_lag_seconds": 0.0, "max_lag_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def handler(kind: str):
+    """Register the function that runs tasks of this kind: fn(db, user_id, payload)."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def defer_shared(db: Session, write: Callable[[Session], None]):
+    """Have the running task apply ``write(session)`` to shared tables exactly once.
+
+    Without sharding it runs right away in the task's own session.
+    """
+    if "shared_writes" in db.info:
+        db.info["shared_writes"].append(write)
+    else:
+        write(db)
+
+
+def _apply_shared(shard: int, task_id: int, writes: list):
+    """Commit a task's shared writes with its receipt, unless an earlier run did."""
+    shared = SessionLocal()
+    try:
+        receipt = dialect_insert(shared, TaskReceipt.__table__).on_conflict_do_nothing(
+            index_elements=["shard", "task_id"]
+        ).values(shard=shard, task_id=task_id, created_at=time.time())
+        if shared.execute(receipt).rowcount:
+            for write in writes:
+                write(shared)
+        shared.commit()
+    finally:
+        shared.close()
+
+
+def enqueue(db: Session, user_id: int, kind: str, payload: dict) -> OutboxTask:
+    """Add a task to the session; it is dispatched once the session commits."""
+    task = OutboxTask(user_id=user_id, kind=kind, payload=json.dumps(payload), created_at=time.time())
+    db.add(task)
+    db.info.setdefault("outbox", []).append(task)
+    return task
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_committed(session):
+    tasks = session.info.pop("outbox", None)
+    if not tasks:
+        return
+    shard = session.info.get("shard")
+    for task in tasks:
+        identity = inspect(task).identity
+        if identity is not None:
+            _offer(shard, identity[0])
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("outbox", None)
+
+
+def _offer(shard: Optional[int], task_id: int):
+    key = (shard, task_id)
+    with _queued_lock:
+        if key in _queued:
+            return
+        try:
+            _queue.put_nowait(key)
+        except queue.Full:
+            # Still in the outbox; the sweeper will pick it up
+            with _stats_lock:
+                _stats["overflowed"] += 1
+            return
+        _queued.add(key)
+
+
+def _open_session(shard: Optional[int]) -> Session:
+    db = SessionLocal()
+    if shard is not None:
+        sharding.route_session(db, shard)
+    return db
+
+
+def _shards():
+    return list(range(len(sharding.shard_engines))) if sharding.is_enabled() else [None]
+
+
+def run_task(shard: Optional[int], task_id: int) -> bool:
+    """Claim and run one task; returns False if another worker has it or it is done."""
+    db = _open_session(shard)
+    try:
+        now = time.time()
+        lease = now + settings.TASK_LEASE_SECONDS
+        claimed = db.query(OutboxTask).filter(
+            OutboxTask.id == task_id,
+            OutboxTask.processed_at.is_(None),
+            or_(OutboxTask.claimed_until.is_(None), OutboxTask.claimed_until < now),
+        ).update({OutboxTask.claimed_until: lease}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return False
+
+        task = db.get(OutboxTask, task_id)
+        kind, user_id, payload, created_at = task.kind, task.user_id, json.loads(task.payload), task.created_at
+        # Conditions on the lease we took: once it has run out, the sweeper may
+        # have handed the task to another worker, whose run is the one that counts
+        held = (OutboxTask.id == task_id, OutboxTask.claimed_until == lease, OutboxTask.processed_at.is_(None))
+        if shard is not None:
+            if sharding.user_location(user_id) != (shard, False):
+                # The user is being moved off this shard; the task runs from their new shard's outbox
+                db.query(OutboxTask).filter(*held).update({OutboxTask.claimed_until: None}, synchronize_session=False)
+                db.commit()
+                return True
+            db.info["shared_writes"] = []
+        try:
+            _handlers[kind](db, user_id, payload)
+            finished = db.query(OutboxTask).filter(*held).update(
+                {OutboxTask.processed_at: time.time()}, synchronize_session=False
+            )
+            if not finished:
+                db.rollback()
+                logger.warning("Task %s (%s) outlived its lease; discarding this run", task_id, kind)
+                with _stats_lock:
+                    _stats["lease_lost"] += 1
+                return True
+            if db.info.get("shared_writes"):
+                # Before the shard commits: if that fails, the rerun finds the receipt
+                _apply_shared(shard, task_id, db.info["shared_writes"])
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Task %s (%s) failed", task_id, kind)
+            db.query(OutboxTask).filter(*held).update({
+                OutboxTask.attempts: OutboxTask.attempts + 1,
+                OutboxTask.last_error: repr(exc)[:1000],
+                OutboxTask.claimed_until: None,
+            }, synchronize_session=False)
+            db.commit()
+            with _stats_lock:
+                _stats["failed"] += 1
+            return True
+
+        lag = time.time() - created_at
+        with _stats_lock:
+            _stats["processed"] += 1
+            _stats["last_lag_seconds"] = lag
+            _stats["max_lag_seconds"] = max(_stats["max_lag_seconds"], lag)
+        return True
+    finally:
+        db.close()
+
+
+def _work():
+    while True:
+        key = _queue.get()
+        if key is None:
+            return
+        with _queued_lock:
+            _queued.discard(key)
+        try:
+            run_task(*key)
+        except Exception:
+            logger.exception("Task worker error")
+
+
+def sweep() -> int:
+    """Queue outbox tasks that are due, and purge old processed ones and their receipts,
+    expired idempotency keys and sync tombstones.
+
+    Returns how many tasks were offered.
+    """
+    offered = 0
+    cutoff = time.time()
+    for shard in _shards():
+        db = _open_session(shard)
+        try:
+            db.query(OutboxTask).filter(
+                OutboxTask.processed_at < cutoff - settings.TASK_RETENTION_SECONDS
+            ).delete(synchronize_session=False)
+            if shard is not None:
+                db.query(TaskReceipt).filter(
+                    TaskReceipt.shard == shard,
+                    TaskReceipt.created_at < cutoff - settings.TASK_RETENTION_SECONDS,
+                ).delete(synchronize_session=False)
+            purge_expired(db)
+            purge_tombstones(db)
+            db.commit()
+            ids = db.query(OutboxTask.id).filter(
+                OutboxTask.processed_at.is_(None),
+                OutboxTask.attempts < settings.TASK_MAX_ATTEMPTS,
+                or_(OutboxTask.claimed_until.is_(None), OutboxTask.claimed_until < cutoff),
+            ).order_by(OutboxTask.id).limit(settings.TASK_QUEUE_SIZE).all()
+        finally:
+            db.close()
+        for (task_id,) in ids:
+            _offer(shard, task_id)
+            offered += 1
+    return offered
+
+
+def _sweep_loop():
+    while not _stopping.wait(settings.TASK_SWEEP_SECONDS):
+        try:
+            sweep()
+        except Exception:
+            logger.exception("Outbox sweep failed")
+
+
+def start():
+    """Start the worker pool and sweeper, picking up anything left from a previous run."""
+    if _threads:
+        return
+    _stopping.clear()
+    for i in range(settings.TASK_WORKERS):
+        thread = threading.Thread(target=_work, name=f"task-worker-{i}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+    sweeper = threading.Thread(target=_sweep_loop, name="task-sweeper", daemon=True)
+    sweeper.start()
+    _threads.append(sweeper)
+    sweep()
+
+
+def stop(timeout: float = 10.0):
+    """Let workers finish the queue, then stop. Unfinished tasks stay in the outbox."""
+    _stopping.set()
+    for _ in range(settings.TASK_WORKERS):
+        _queue.put(None)
+    deadline = time.monotonic() + timeout
+    for thread in _threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    _threads.clear()
+
+
+def metrics() -> dict:
+    """Queue depth, throughput and lag, plus the outbox backlog per shard."""
+    now = time.time()
+    backlog = []
+    for shard in _shards():
+        db = _open_session(shard)
+        try:
+            pending, oldest = db.query(func.count(OutboxTask.id), func.min(OutboxTask.created_at)).filter(
+                OutboxTask.processed_at.is_(None),
+                OutboxTask.attempts < settings.TASK_MAX_ATTEMPTS,
+            ).one()
+            dead = db.query(func.count(OutboxTask.id)).filter(
+                OutboxTask.processed_at.is_(None),
+                OutboxTask.attempts >= settings.TASK_MAX_ATTEMPTS,
+            ).scalar()
+        finally:
+            db.close()
+        backlog.append({
+            "shard": shard,
+            "pending": pending,
+            "oldest_pending_age_seconds": now - oldest if oldest else 0.0,
+            "dead": dead,
+        })
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        "queue_depth": _queue.qsize(),
+        "workers": settings.TASK_WORKERS,
+        **stats,
+        "outbox": backlog,
+    }
@@ -0,0 +1,39 @@
+"""
+Move old mastered mistakes from wrong_questions into wrong_questions_archive.
+
+Safe to interrupt: progress is checkpointed after every batch and the next
+run resumes from there. Run it periodically, e.g. nightly from cron.
+
+    python archive_mistakes.py [--age-days 30] [--batch-size 1000] [--pause 0.2] [--max-batches N]
+"""
+import argparse
+
+from app import sharding
+from app.database import Base, engine
+from app.mistake_archive import run_archiver
+from app.models import User  # noqa: F401  (registers all models)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--age-days", type=int, help="default: MISTAKE_ARCHIVE_AGE_DAYS")
+    parser.add_argument("--batch-size", type=int, help="default: MISTAKE_ARCHIVE_BATCH_SIZE")
+    parser.add_argument("--pause", type=float, help="seconds between batches; default: MISTAKE_ARCHIVE_PAUSE_SECONDS")
+    parser.add_argument("--max-batches", type=int, help="stop after this many batches per database")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    if sharding.is_enabled():
+        sharding.create_all()
+    else:
+        Base.metadata.create_all(bind=engine)
+    moved = run_archiver(
+        age_days=args.age_days,
+        batch_size=args.batch_size,
+        pause=args.pause,
+        max_batches=args.max_batches,
+        log=(lambda message: None) if args.quiet else print,
+    )
+    print(f"Archived {moved} mastered mistakes.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Find near-duplicate questions across the catalog, or check one lesson against it.
+
+Refreshes the persisted MinHash signatures first (only questions changed
+since the last run are re-signed).
+
+    python audit_content.py [--threshold 0.8] [--rebuild]
+    python audit_content.py --lesson 42
+    python audit_content.py --file new_lesson.json   # a lesson's content: [{"question": ..., "answer": ...}, ...]
+"""
+import argparse
+import json
+
+from app import sharding
+from app.content_audit import check_lesson, check_questions, find_clusters, refresh_index
+from app.database import Base, SessionLocal, engine
+from app.models import User  # noqa: F401  (registers all models)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, help="default: CONTENT_AUDIT_THRESHOLD")
+    parser.add_argument("--lesson", type=int, help="check this lesson against the rest of the catalog")
+    parser.add_argument("--file", help="check a lesson content JSON file not yet imported")
+    parser.add_argument("--rebuild", action="store_true", help="re-sign every question")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    if sharding.is_enabled():
+        sharding.create_all()
+    else:
+        Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        signed = refresh_index(db, rebuild=args.rebuild, log=None if args.json else print)
+        if not args.json:
+            print(f"Signed {signed} new or changed questions.")
+        if args.lesson is not None or args.file:
+            if args.file:
+                with open(args.file) as f:
+                    report = check_questions(db, json.load(f), threshold=args.threshold)
+            else:
+                report = check_lesson(db, args.lesson, threshold=args.threshold)
+            if args.json:
+                print(json.dumps(report, indent=2))
+                return
+            for item in report:
+                for match in item["matches"]:
+                    print(f"#{item['position'] + 1} {item['question']!r} ~ lesson {match['lesson_id']} "
+                          f"question {match['question_id']} {match['question']!r} ({match['similarity']:.2f})")
+            print(f"{sum(1 for item in report if item['matches'])} of {len(report)} questions have near duplicates.")
+            return
+        clusters = find_clusters(db, args.threshold)
+        if args.json:
+            print(json.dumps(clusters, indent=2))
+            return
+        for cluster in clusters:
+            print(f"{cluster['size']} similar questions:")
+            for q in cluster["questions"]:
+                print(f"  lesson {q['lesson_id']} question {q['question_id']} ({q['similarity']:.2f}): {q.get('question')!r}")
+        print(f"{len(clusters)} clusters, {sum(c['size'] for c in clusters)} questions.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
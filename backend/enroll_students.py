@@ -0,0 +1,41 @@
+"""
+Create student accounts from a CSV or NDJSON roster.
+
+Rows need email and username; a password is generated for rows without one
+and printed in the report. One NDJSON result line is written per row.
+
+    python enroll_students.py roster.csv [--format csv|ndjson] [--report results.ndjson] [--chunk-size 1000]
+"""
+import argparse
+import json
+import sys
+
+from app import sharding
+from app.database import Base, engine
+from app.enrollment import FORMATS, enroll, read_roster
+from app.models import User  # noqa: F401  (registers all models)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("roster")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--report", help="write results here instead of stdout")
+    parser.add_argument("--chunk-size", type=int, help="default: ENROLL_CHUNK_SIZE")
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.roster.lower().endswith(".csv") else "ndjson")
+
+    if sharding.is_enabled():
+        sharding.create_all()
+    else:
+        Base.metadata.create_all(bind=engine)
+    report = open(args.report, "w") if args.report else sys.stdout
+    with open(args.roster, encoding="utf-8-sig", newline="") as roster:
+        for result in enroll(read_roster(roster, fmt), chunk_size=args.chunk_size):
+            report.write(json.dumps(result) + "\n")
+            if "summary" in result:
+                print(", ".join(f"{count} {status}" for status, count in result["summary"].items()), file=sys.stderr)
+    if report is not sys.stdout:
+        report.close()
+
+if __name__ == "__main__":
+    main()
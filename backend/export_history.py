@@ -0,0 +1,31 @@
+"""
+Dump learner history to a file or stdout without loading it into memory.
+
+    python export_history.py user_progress --format csv --start 2024-01-01 -o progress.csv
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from app.export import EXPORT_TABLES, FORMATS, export_chunks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="inclusive ISO date/time")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="exclusive ISO date/time")
+    parser.add_argument("--level-id", type=int)
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in export_chunks(args.table, args.format, start=args.start, end=args.end, level_id=args.level_id):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
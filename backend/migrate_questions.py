@@ -0,0 +1,27 @@
+"""
+Unpack the legacy Lesson.content JSON into rows of the questions table.
+
+    python migrate_questions.py [--clear-content]
+"""
+import argparse
+
+from app.database import SessionLocal, engine, Base
+from app.catalog import unpack_lesson_content
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clear-content", action="store_true",
+                        help="empty Lesson.content once its questions are unpacked")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        migrated = unpack_lesson_content(db, clear_content=args.clear_content)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Unpacked questions for {migrated} lessons.")
+
+if __name__ == "__main__":
+    main()
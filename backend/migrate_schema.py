@@ -0,0 +1,130 @@
+"""
+Add the columns and indexes the models define to tables that already exist.
+
+create_all only creates missing tables, so a database from an earlier release
+lacks columns added since (users.sync_version, sync_floor, completed_lessons
+and completed_layout, sync_tombstones.created_at, ...). This adds them, with
+the column's default for existing rows, and rebuilds SQLite tables that now
+use AUTOINCREMENT, on the shared database and, with sharding on, every shard.
+Run it before starting the new release.
+
+    python migrate_schema.py [--dry-run]
+"""
+import argparse
+
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import sharding
+from app.database import engine, Base
+from app.models import User  # noqa: F401  (registers all models)
+
+# Rows that would violate a new unique index, deleted (keeping the oldest) before it is created
+DEDUPLICATE = {
+    "uq_wrong_questions_user_question": (
+        "DELETE FROM wrong_questions WHERE id NOT IN "
+        "(SELECT MIN(id) FROM wrong_questions GROUP BY user_id, lesson_id, question_id)"
+    ),
+}
+
+# Run after a table is rebuilt for AUTOINCREMENT. Archived mistakes keep their
+# wrong_questions id, so new ids must start above those as well.
+AFTER_REBUILD = {
+    "wrong_questions": [
+        "DELETE FROM sqlite_sequence WHERE name = 'wrong_questions'",
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'wrong_questions', COALESCE(MAX(id), 0) "
+        "FROM (SELECT id FROM wrong_questions UNION ALL SELECT id FROM wrong_questions_archive)",
+    ],
+}
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    default = column.default
+    if default is not None and (default.is_scalar or default.is_callable):
+        value = default.arg(None) if default.is_callable else default.arg
+        ddl += f" DEFAULT {literal(value).compile(dialect=dialect, compile_kwargs={'literal_binds': True})}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    return ddl
+
+def _needs_autoincrement(bind, table) -> bool:
+    """SQLite only sets AUTOINCREMENT in CREATE TABLE, so adding it means rebuilding the table."""
+    if bind.dialect.name != "sqlite" or not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    with bind.connect() as conn:
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                           {"name": table.name}).scalar()
+    return "AUTOINCREMENT" not in ddl.upper()
+
+def _rebuild_ddl(bind, table) -> list:
+    old = f"{table.name}_rebuild"
+    columns = ", ".join(column.name for column in table.columns)
+    return [
+        f"ALTER TABLE {table.name} RENAME TO {old}",
+        str(CreateTable(table).compile(dialect=bind.dialect)).strip(),
+        f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}",
+        f"DROP TABLE {old}",  # and its indexes, which are created again below
+    ] + AFTER_REBUILD.get(table.name, [])
+
+def missing_ddl(bind, tables) -> list:
+    """ALTER TABLE and CREATE INDEX statements for what ``tables`` define but the database lacks."""
+    inspector = inspect(bind)
+    statements = []
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue  # create_all makes it whole
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                statements.append(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column, bind.dialect)}")
+        if _needs_autoincrement(bind, table):
+            statements.extend(_rebuild_ddl(bind, table))
+            indexes = set()
+        else:
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                if index.name in DEDUPLICATE:
+                    statements.append(DEDUPLICATE[index.name])
+                statements.append(str(CreateIndex(index).compile(dialect=bind.dialect)))
+    return statements
+
+def targets():
+    """(name, engine, tables) for the shared database and every shard."""
+    if not sharding.is_enabled():
+        return [("database", engine, Base.metadata.sorted_tables)]
+    user_tables = [model.__table__ for model in sharding.user_owned_models()]
+    shard_tables = sharding.shard_metadata(user_tables).sorted_tables
+    return [("shared database", engine, [t for t in Base.metadata.sorted_tables if t not in user_tables])] + [
+        (f"shard {i}", shard_engine, shard_tables) for i, shard_engine in enumerate(sharding.shard_engines)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only print the statements")
+    args = parser.parse_args()
+
+    for bind in (engine, *sharding.shard_engines):
+        bind.echo = False
+    if not args.dry_run:
+        # Tables that do not exist yet are created whole; some changes below read them
+        if sharding.is_enabled():
+            sharding.create_all()
+        else:
+            Base.metadata.create_all(bind=engine)
+    for name, bind, tables in targets():
+        statements = missing_ddl(bind, tables)
+        print(f"{name}: {len(statements)} change(s)")
+        for statement in statements:
+            print(f"  {statement}")
+        if args.dry_run or not statements:
+            continue
+        with bind.begin() as conn:
+            if bind.dialect.name == "sqlite":
+                # pysqlite leaves DDL outside transactions; all of a database's changes apply or none do
+                conn.exec_driver_sql("BEGIN")
+            for statement in statements:
+                conn.execute(text(statement))
+
+if __name__ == "__main__":
+    main()
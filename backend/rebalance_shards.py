@@ -0,0 +1,42 @@
+"""
+Move users between shards after SHARD_DATABASE_URLS or SHARD_ROUTER changes.
+
+    python rebalance_shards.py --dry-run
+    python rebalance_shards.py --import-unsharded   # first-time split of a single database
+
+Safe to run while the app is serving. Users in the batch being moved get 503
+on writes, and their background tasks wait, for about twice
+SHARD_DIRECTORY_CACHE_SECONDS + SHARD_MOVE_GRACE_SECONDS per batch. Shards
+that still hold users must stay in SHARD_DATABASE_URLS until drained.
+"""
+import argparse
+
+from app import sharding
+from app.models import User  # noqa: F401  (registers all models)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="only report users that would move")
+    parser.add_argument("--offline", action="store_true",
+                        help="the app and task workers are stopped: skip waiting for directory caches to expire")
+    parser.add_argument("--import-unsharded", action="store_true",
+                        help="copy users from the shared DATABASE_URL into the shards")
+    args = parser.parse_args()
+
+    if not sharding.is_enabled():
+        parser.error("SHARD_DATABASE_URLS is empty; sharding is disabled")
+    sharding.create_all()
+
+    if args.import_unsharded:
+        count = sharding.import_unsharded(batch_size=args.batch_size)
+        print(f"Imported {count} users into {len(sharding.shard_engines)} shards.")
+    else:
+        try:
+            count = sharding.rebalance(batch_size=args.batch_size, dry_run=args.dry_run, wait=not args.offline)
+        except ValueError as exc:
+            parser.error(str(exc))
+        print(f"{'Would move' if args.dry_run else 'Moved'} {count} users.")
+
+if __name__ == "__main__":
+    main()
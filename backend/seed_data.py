@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine, Base
 from app.models.level import Level
 from app.models.lesson import Lesson
+from app.catalog import unpack_lesson_content
 
 def seed():
     # Create tables if they don't exist
@@ -226,6 +227,10 @@ def seed():
         )
         db.add(lesson)
     
+    # Store the questions as rows of the questions table
+    db.flush()
+    unpack_lesson_content(db, clear_content=True)
+    
     db.commit()
     print("Successfully seeded 5 Levels with 3 Lessons each!")
     db.close()
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings are read at import time: point the app at a throwaway database first
+_db_dir = tempfile.mkdtemp(prefix="englishquest-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/test.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import seed_data  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    seed_data.seed()
+    return TestClient(app)
+
+
+@pytest.fixture
+def auth_headers(client, request):
+    name = request.node.name.replace("[", "-").replace("]", "")
+    response = client.post(
+        "/api/auth/register",
+        json={"email": f"{name}@example.com", "username": name, "password": "secret"},
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import tracemalloc
+
+from app.events import EventHub, event_stream, format_event, hub
+
+
+def test_stalled_client_gets_only_the_latest_event():
+    async def scenario():
+        stream = event_stream(["user:test-stalled"], heartbeat=60)
+        assert await stream.__anext__() == "retry: 5000\n\n"
+        # The client stops reading while its stats keep changing
+        for coins in range(1000):
+            hub.publish("user:test-stalled", "stats", {"coins": coins})
+        frame = await stream.__anext__()
+        await stream.aclose()
+        return frame
+
+    assert asyncio.run(scenario()) == format_event("stats", {"coins": 999})
+    assert not hub.has_subscribers("user:test-stalled")
+
+
+def test_publishing_to_idle_subscribers_does_not_grow_memory():
+    clients, rounds = 1000, 30
+
+    async def scenario():
+        local = EventHub()
+        subscribers = [local.subscribe(["leaderboard", f"user:{i}"]) for i in range(clients)]
+
+        def publish(round_):
+            for i in range(clients):
+                local.publish(f"user:{i}", "stats", {"coins": round_, "padding": "x" * 100})
+            local.publish("leaderboard", "leaderboard", [{"rank": 1, "experience": round_}])
+
+        async def publish_round(round_):
+            # Request handlers publish from worker threads
+            thread = threading.Thread(target=publish, args=(round_,))
+            thread.start()
+            thread.join()
+            await asyncio.sleep(0.05)
+
+        await publish_round(0)
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        for round_ in range(1, rounds):
+            await publish_round(round_)
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return subscribers, after - before
+
+    subscribers, growth = asyncio.run(scenario())
+    # Nobody read anything: each client still holds one pending event per type, the latest
+    assert all(len(s.pending) == 2 for s in subscribers)
+    assert all(s.pending["stats"]["coins"] == rounds - 1 for s in subscribers)
+    # Growth is the latest round's pending events, which tracemalloc saw allocated
+    # (but not the round-0 ones they replaced); a queue would hold every round
+    assert growth < clients * 500
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import tracemalloc
+
+import pytest
+from sqlalchemy import delete, insert
+
+from app.database import SessionLocal, engine
+from app.export import EXPORT_TABLES, export_chunks, export_columns
+from app.models.user import User
+from app.models.wrong_question import WrongQuestion
+
+
+@pytest.fixture
+def admin_headers(client, auth_headers):
+    # A completed lesson gives the user a completion bitmap
+    assert client.post("/api/progress/submit", json={"lesson_id": 1, "score": 100}, headers=auth_headers).status_code == 200
+    user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.id == user_id).update({User.is_superuser: True})
+        db.commit()
+    finally:
+        db.close()
+    return auth_headers
+
+
+@pytest.mark.parametrize("table", sorted(EXPORT_TABLES))
+def test_ndjson_export_is_json_serializable(client, admin_headers, table):
+    response = client.get(f"/api/admin/export/{table}", params={"format": "ndjson"}, headers=admin_headers)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert all(list(row) == export_columns(table) for row in rows)
+
+
+def test_users_export_leaves_out_internal_columns(client, admin_headers):
+    response = client.get("/api/admin/export/users", params={"format": "csv"}, headers=admin_headers)
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == export_columns("users")
+    assert len(rows) > 1
+    for hidden in ("hashed_password", "completed_lessons", "completed_layout", "sync_version"):
+        assert hidden not in rows[0]
+
+
+def test_export_streams_in_bounded_memory(client):
+    rows = 30000
+    hot = WrongQuestion.__table__
+    with engine.begin() as conn:
+        conn.execute(insert(hot), [
+            {"user_id": 10**7, "lesson_id": 1, "question_id": i, "question_text": f"question {i} " + "x" * 200,
+             "correct_answer": "a", "user_answer": "b", "mastered": False, "sync_version": 1}
+            for i in range(rows)
+        ])
+    try:
+        tracemalloc.start()
+        exported = lines = 0
+        for chunk in export_chunks("wrong_questions", "ndjson"):
+            exported += len(chunk)
+            lines += chunk.count("\n")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert lines >= rows
+        # A few batches in flight, not the whole table: the peak (about 2.6 MB)
+        # does not grow with the row count, while the export here is about 13 MB
+        assert peak < exported / 3
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(hot).where(hot.c.user_id == 10**7))
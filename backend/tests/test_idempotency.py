@@ -0,0 +1,75 @@
+import contextlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import idempotency, tasks
+from app.database import SessionLocal
+from app.models.idempotency_key import IdempotencyKey
+
+SUBMITS = 16
+SUBMIT = {"lesson_id": 1, "score": 100}
+
+
+def _experience(client, headers) -> int:
+    return client.get("/api/auth/me", headers=headers).json()["experience"]
+
+
+def _hammer(client, headers, key, body=SUBMIT):
+    def submit(_):
+        response = client.post("/api/progress/submit", json=body, headers={**headers, "Idempotency-Key": key})
+        return response.status_code, json.dumps(response.json(), sort_keys=True)
+
+    with ThreadPoolExecutor(SUBMITS) as pool:
+        return list(pool.map(submit, range(SUBMITS)))
+
+
+@pytest.fixture
+def separate_workers(monkeypatch):
+    """Same-key requests as if each came to a different worker: no shared lock or cache."""
+    monkeypatch.setattr(idempotency, "_key_lock", lambda cache_key: contextlib.nullcontext())
+    monkeypatch.setattr(idempotency, "_cache", idempotency.ResponseCache(0))
+
+
+def test_concurrent_same_key_awards_once(client, auth_headers):
+    before = _experience(client, auth_headers)
+    results = _hammer(client, auth_headers, "same-key")
+    assert {status for status, _ in results} == {200}
+    assert len({body for _, body in results}) == 1
+    gained = json.loads(results[0][1])["experience_gained"]
+    assert _experience(client, auth_headers) == before + gained
+
+
+def test_concurrent_same_key_across_workers_awards_once(client, auth_headers, separate_workers):
+    before = _experience(client, auth_headers)
+    results = _hammer(client, auth_headers, "same-key")
+    # Losers either replay the winner or, on SQLite, may fail to get the write lock
+    bodies = {body for status, body in results if status == 200}
+    assert len(bodies) == 1
+    gained = json.loads(bodies.pop())["experience_gained"]
+    assert _experience(client, auth_headers) == before + gained
+
+
+def test_key_reused_for_different_request_is_rejected(client, auth_headers):
+    headers = {**auth_headers, "Idempotency-Key": "reused"}
+    assert client.post("/api/progress/submit", json=SUBMIT, headers=headers).status_code == 200
+    other = {**SUBMIT, "lesson_id": 2}
+    assert client.post("/api/progress/submit", json=other, headers=headers).status_code == 422
+
+
+def test_sweep_purges_expired_keys(client):
+    now = int(time.time())
+    db = SessionLocal()
+    try:
+        db.add_all([
+            IdempotencyKey(user_id=0, key="expired", endpoint="e", fingerprint="f", response="{}", expires_at=now - 1),
+            IdempotencyKey(user_id=0, key="live", endpoint="e", fingerprint="f", response="{}", expires_at=now + 60),
+        ])
+        db.commit()
+        tasks.sweep()
+        db.expire_all()
+        assert {row.key for row in db.query(IdempotencyKey).filter(IdempotencyKey.user_id == 0)} == {"live"}
+    finally:
+        db.close()
@@ -0,0 +1,21 @@
+def test_start_does_not_reveal_answers(client, auth_headers):
+    response = client.post("/api/lessons/1/start", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    questions = response.json()["questions"]
+    assert questions
+    assert all("answer" not in question for question in questions)
+
+
+def _grade(client, headers, lesson_id, token, extra_headers=None):
+    body = {"attempts": [{"lesson_id": lesson_id, "answers": [], "attempt_token": token}]}
+    return client.post("/api/progress/grade", json=body, headers={**headers, **(extra_headers or {})})
+
+
+def test_attempt_token_is_single_use(client, auth_headers):
+    token = client.post("/api/lessons/1/start", headers=auth_headers).json()["attempt_token"]
+    first = _grade(client, auth_headers, 1, token, {"Idempotency-Key": "attempt-once"})
+    assert first.status_code == 200, first.text
+    # A retry with the same Idempotency-Key replays; a fresh submission of the token is refused
+    assert _grade(client, auth_headers, 1, token, {"Idempotency-Key": "attempt-once"}).json() == first.json()
+    assert _grade(client, auth_headers, 1, token).status_code == 409
+    assert _grade(client, auth_headers, 1, token, {"Idempotency-Key": "attempt-twice"}).status_code == 409
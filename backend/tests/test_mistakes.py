@@ -0,0 +1,45 @@
+from app.api.progress import record_mistakes
+from app.database import SessionLocal
+from app.mistake_archive import archive_mistakes
+from app.models.question import Question
+from app.models.wrong_question import ArchivedWrongQuestion, WrongQuestion
+
+
+def test_recording_a_mistake_twice_keeps_one_entry(client, auth_headers):
+    user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+    db = SessionLocal()
+    try:
+        first, second = [q.question_id for q in db.query(Question).filter(Question.lesson_id == 1).limit(2)]
+        record_mistakes(db, user_id, 1, {first: "x"})
+        db.commit()
+        record_mistakes(db, user_id, 1, {first: "y", second: "z"})
+        db.commit()
+        rows = db.query(WrongQuestion).filter(WrongQuestion.user_id == user_id).all()
+        assert sorted(row.question_id for row in rows) == sorted([first, second])
+        assert {row.question_id: row.user_answer for row in rows}[first] == "x"
+    finally:
+        db.close()
+
+
+def test_archiving_a_row_already_in_the_archive_is_skipped(client, auth_headers):
+    user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+    db = SessionLocal()
+    try:
+        row = WrongQuestion(
+            user_id=user_id, lesson_id=1, question_id=1, question_text="q",
+            correct_answer="a", user_answer="b", mastered=True,
+        )
+        db.add(row)
+        db.commit()
+        # A replayed batch: the archive already holds this id
+        db.add(ArchivedWrongQuestion(
+            id=row.id, user_id=user_id, lesson_id=1, question_id=1, question_text="q",
+            correct_answer="a", user_answer="b", sync_version=row.sync_version,
+        ))
+        db.commit()
+        assert archive_mistakes(db, WrongQuestion.__table__.c.id == row.id) == 1
+        db.commit()
+        assert db.query(WrongQuestion).filter(WrongQuestion.user_id == user_id).count() == 0
+        assert db.query(ArchivedWrongQuestion).filter(ArchivedWrongQuestion.user_id == user_id).count() == 1
+    finally:
+        db.close()
@@ -0,0 +1,116 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+
+from app import sharding
+from app.database import SessionLocal
+from app.mistake_archive import archive_mistakes
+from app.models.sync_tombstone import SyncTombstone
+from app.models.user import User
+from app.models.user_directory import UserDirectory
+from app.models.wrong_question import ArchivedWrongQuestion, WrongQuestion
+
+
+class ToShard(sharding.ShardRouter):
+    target = 1
+
+    def shard_for(self, user_id: int) -> int:
+        return self.target
+
+
+@pytest.fixture
+def shards(client, monkeypatch, tmp_path):
+    engines = [create_engine(f"sqlite:///{tmp_path}/shard{i}.db") for i in range(2)]
+    metadata = sharding.shard_metadata([model.__table__ for model in sharding.user_owned_models()])
+    for shard_engine in engines:
+        metadata.create_all(bind=shard_engine)
+    monkeypatch.setattr(sharding, "shard_engines", engines)
+    monkeypatch.setattr(sharding, "router", ToShard(len(engines)))
+    yield engines
+    with SessionLocal() as db:
+        db.query(UserDirectory).delete()
+        db.commit()
+    sharding._directory_cache.clear()
+
+
+def _add_user(email: str, shard: int, moving: bool = False) -> int:
+    with SessionLocal() as db:
+        entry = UserDirectory(email=email, username=email.split("@")[0], shard=shard, moving=moving)
+        db.add(entry)
+        db.commit()
+        user_id = entry.id
+    with sharding.shard_session(shard) as db:
+        db.add(User(id=user_id, email=email, username=email.split("@")[0], hashed_password="x"))
+        db.commit()
+    return user_id
+
+
+def test_writes_for_a_moving_user_are_refused(shards):
+    user_id = _add_user("moving@example.com", shard=0, moving=True)
+    with SessionLocal() as db:
+        assert sharding.route_session_for_subject(db, "moving@example.com") == 0
+        db.get(User, user_id).coins = 10
+        with pytest.raises(HTTPException) as refused:
+            db.flush()
+        assert refused.value.status_code == 503
+
+
+def test_rebalance_rejects_unknown_shards(shards, monkeypatch):
+    _add_user("stranded@example.com", shard=0)
+    monkeypatch.setattr(sharding.router, "target", 2)
+    with pytest.raises(ValueError, match="shard 2"):
+        sharding.rebalance(log=lambda message: None, wait=False)
+
+
+def _mistake(user_id: int, question_id: int, mastered: bool = False) -> WrongQuestion:
+    return WrongQuestion(
+        user_id=user_id, lesson_id=1, question_id=question_id, question_text="q",
+        correct_answer="a", user_answer="b", mastered=mastered,
+    )
+
+
+def test_rebalance_renumbers_mistakes_and_forces_full_sync(shards):
+    # Another user's notebook on the target already uses the low ids
+    with sharding.shard_session(1) as db:
+        db.add_all([_mistake(10**6, question_id) for question_id in (1, 2, 3)])
+        db.commit()
+
+    user_id = _add_user("mover@example.com", shard=0)
+    with sharding.shard_session(0) as db:
+        db.add_all([_mistake(user_id, 1), _mistake(user_id, 2, mastered=True)])
+        db.commit()
+        archive_mistakes(db, WrongQuestion.__table__.c.user_id == user_id)
+        db.commit()
+        # Missed again after it was archived
+        db.add(_mistake(user_id, 2))
+        db.commit()
+        assert db.query(SyncTombstone).filter(SyncTombstone.user_id == user_id).count() == 1
+        version = db.get(User, user_id).sync_version
+
+    assert sharding.rebalance(log=lambda message: None, wait=False) == 1
+
+    with sharding.shard_session(0) as db:
+        assert db.get(User, user_id) is None
+        assert db.query(WrongQuestion).filter(WrongQuestion.user_id == user_id).count() == 0
+    with sharding.shard_session(1) as db:
+        hot = db.query(WrongQuestion).filter(WrongQuestion.user_id == user_id).order_by(WrongQuestion.id).all()
+        archived = db.query(ArchivedWrongQuestion).filter(ArchivedWrongQuestion.user_id == user_id).all()
+        assert [row.question_id for row in hot] == [1, 2]
+        assert [row.question_id for row in archived] == [2]
+        # New ids from the target's sequence, in the original order, shared by both tables
+        assert min(row.id for row in hot) > 3
+        assert hot[0].id < archived[0].id < hot[1].id
+        # Ids handed out later do not collide with the archived one
+        later = _mistake(user_id, 3)
+        db.add(later)
+        db.commit()
+        assert later.id > hot[1].id
+
+        # Tombstones named the old ids; clients resync in full instead
+        assert db.query(SyncTombstone).filter(SyncTombstone.user_id == user_id).count() == 0
+        user = db.get(User, user_id)
+        assert user.sync_floor == version + 1
+        assert user.sync_version > version
+
+    with SessionLocal() as db:
+        assert db.get(UserDirectory, user_id).shard == 1
@@ -0,0 +1,42 @@
+from app import tasks
+from app.database import SessionLocal
+from app.models.sync_tombstone import SyncTombstone
+from app.models.user import User
+
+
+def _sync(client, headers, since):
+    return client.get("/api/sync/", params={"since": since}, headers=headers)
+
+
+def test_sync_past_purged_tombstones_is_full(client, auth_headers):
+    user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+    seen = _sync(client, auth_headers, 0).json()["version"]
+
+    db = SessionLocal()
+    try:
+        db.get(User, user_id).coins += 1
+        db.commit()
+        version = db.get(User, user_id).sync_version
+        # A deletion the client has not seen, recorded longer ago than the retention window
+        db.add(SyncTombstone(user_id=user_id, kind="mistake", row_id=999, sync_version=version, created_at=0.0))
+        db.commit()
+    finally:
+        db.close()
+
+    delta = _sync(client, auth_headers, seen).json()
+    assert not delta["full"]
+    assert {"kind": "mistake", "id": 999} in delta["removed"]
+
+    tasks.sweep()
+    full = _sync(client, auth_headers, seen).json()
+    assert full["full"]
+    assert full["version"] == version
+    assert {"kind": "mistake", "id": 999} not in full["removed"]
+    assert _sync(client, auth_headers, version).status_code == 304
+
+
+def test_rebuilding_completion_bitmap_does_not_bump_version(client, auth_headers):
+    version = _sync(client, auth_headers, 0).json()["version"]
+    # The new user has no bitmap yet; /next builds and stores it
+    assert client.get("/api/progress/next", headers=auth_headers).status_code == 200
+    assert _sync(client, auth_headers, version).status_code == 304
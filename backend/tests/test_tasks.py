@@ -0,0 +1,54 @@
+from app import tasks
+from app.database import SessionLocal
+from app.models.outbox_task import OutboxTask
+from app.models.user import User
+
+@tasks.handler("test_add_coin")
+def add_coin(db, user_id, payload):
+    if payload.get("steal_lease"):
+        # The sweeper handed the task to another worker while this one ran
+        other = SessionLocal()
+        try:
+            other.query(OutboxTask).filter(
+                OutboxTask.user_id == user_id, OutboxTask.processed_at.is_(None)
+            ).update({OutboxTask.claimed_until: 0.0})
+            other.commit()
+        finally:
+            other.close()
+    db.query(User).filter(User.id == user_id).update({User.coins: User.coins + 1})
+
+
+def _user_id(client, headers) -> int:
+    return client.get("/api/auth/me", headers=headers).json()["id"]
+
+
+def _run(user_id: int, steal_lease: bool):
+    db = SessionLocal()
+    try:
+        task = tasks.enqueue(db, user_id, "test_add_coin", {"steal_lease": steal_lease})
+        db.commit()
+        task_id = task.id
+    finally:
+        db.close()
+    assert tasks.run_task(None, task_id)
+    db = SessionLocal()
+    try:
+        return db.get(OutboxTask, task_id), db.get(User, user_id).coins
+    finally:
+        db.close()
+
+
+def test_task_commits_while_lease_held(client, auth_headers):
+    user_id = _user_id(client, auth_headers)
+    task, coins = _run(user_id, steal_lease=False)
+    assert task.processed_at is not None
+    assert coins == 1
+
+
+def test_task_outliving_its_lease_is_discarded(client, auth_headers):
+    user_id = _user_id(client, auth_headers)
+    before = tasks.metrics()["lease_lost"]
+    task, coins = _run(user_id, steal_lease=True)
+    assert task.processed_at is None
+    assert coins == 0
+    assert tasks.metrics()["lease_lost"] == before + 1